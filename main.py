@@ -1,50 +1,303 @@
+import argparse
+import contextlib
+import glob
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
 from scripts.Modeler import *
 from scripts.Sol import *
+from scripts.Solver import *
+from scripts.Fleet import *
+from scripts.Cache import estimateName, loadTour, saveTour
+from scripts.Network import loadKeys
+from scripts.Profiler import Profiler
 
 FILENAME = "AddressesFull"
 
-# Open API Keys
-with open("Keys.json", "r") as data:
-    Keys = json.load(data)
-
 # ------------------------------------------ Solve or Interpret Functions ------------------------------------------- #
 
-def solve(filename:str,key:str=None) -> None:
-    """ Generate the model and associated LP File for a data set
+def solve(filename:str,key:str=None,method:str='lp',vehicles:int=None,cluster:str='kmeans',capacity:float=None,incremental:bool=False,**cacheArgs):
+    """ Generate the model and associated LP File for a data set, or solve it right here with one of the native solvers
 
     # Arguments #
     :arg filename: Generic name of the input data file
     :type filename: str
     :arg key: API key needed to call Google Maps if no cached data
     :type key: str
+    :arg method: 'lp' writes LPFiles/<filename>.lp for an outside solver, 'heuristic' solves in process, 'exact' solves small sites optimally
+    :type method: str
+    :arg vehicles: Split the stops over this many vehicles leaving from location 0, see solveFleet. Needs Latitude and Longitude
+    :type vehicles: int
+    :arg cluster: 'kmeans' or 'sweep', how stops are split between vehicles
+    :type cluster: str
+    :arg capacity: Most stops one vehicle can take, or most of the Demand column if the data has one
+    :type capacity: float
+    :arg incremental: Start from the last tour saved for this file, only re-planning around stops added or removed since.
+        With 'lp', the re-planned tour is written as a MIP start to LPFiles/<filename>.mst
+    :type incremental: bool
+    :arg cacheArgs: passed on to validateCache, ex. provider='greatcircle' to prototype with no API calls, or prefilter=10
+    :type cacheArgs: dict
+
+    # Returns #
+    :return routes: For the native solvers, each location mapped to the one visited after it, like solInterpreter returns.
+        With vehicles or capacity, a list of those, one per vehicle
+    :rtype routes: dict or list
     """
     # Open the data, put it in Pandas
     with open(f"Data/{filename}.csv", "r") as data:
         df = pd.read_csv(data)
-        # Make the addresses API friendly
-        df = df.replace(' ', '+', regex=True)
     # Get distance matrix
-    distMatrix = validateCache(filename,df,key)
-    constMatrix = generateContraintMatrix(distMatrix)
-    # Write LP File for solve
-    lpGenerator(distMatrix, constMatrix, filename)
+    distMatrix = validateCache(filename,df,key,**cacheArgs)
+    previous = previousTour(filename, df) if incremental and vehicles is None and capacity is None else None
+    if method == 'lp':
+        if vehicles is not None or capacity is not None:
+            raise ValueError('The LP model is a single tour, solve a fleet with the heuristic or exact method')
+        constMatrix = generateContraintMatrix(distMatrix)
+        # Write LP File for solve, starting the solver from the last tour if there is one
+        lpGenerator(distMatrix, constMatrix, filename, start=repairTour(distMatrix, previous) if previous is not None else None)
+        return None
+    if vehicles is not None or capacity is not None:
+        fleet = solveFleet(distMatrix, df[['Latitude', 'Longitude']].to_numpy(), vehicles, cluster, capacity,
+                           df['Demand'].to_numpy() if 'Demand' in df.columns else None, method=method)
+        fleetInterpreter(fleet, distMatrix, df)
+        return fleet
+    if previous is not None:
+        routes = repairTour(distMatrix, previous)
+    elif method == 'heuristic':
+        routes = solveHeuristic(distMatrix)
+    elif method == 'exact':
+        routes = solveExact(distMatrix)
+    else:
+        raise ValueError(f'Unknown solve method "{method}"')
+    saveTour(filename, routes, df['Address'].tolist())
+    print(f'Tour of {len(routes)} locations, total distance {tourLength(distMatrix, routesToOrder(routes)):.2f}')
+    return routes
+
+def previousTour(filename:str, df:pd.DataFrame) -> np.ndarray:
+    """ The last tour saved for a data file, renumbered for its addresses now, see loadTour. Says what changed since
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+    :arg df: The locations as they are now
+    :type df: pd.DataFrame
 
-def interpret(filename:str) -> None:
+    # Returns #
+    :return previous: The old tour as current location numbers, -1 for removed stops. None if there is no saved tour
+    :rtype previous: np.ndarray
+    """
+    previous = loadTour(filename, df['Address'].tolist())
+    if previous is None:
+        print(f'No saved tour for {filename}, solving from scratch')
+        return None
+    kept = previous[previous >= 0]
+    print(f'Re-planning {filename}: {len(previous) - len(kept)} stops removed, {len(df) - len(kept)} added since the last tour')
+    return previous
+
+def interpret(filename:str, provider:str='directions') -> None:
     """ Reads a .sol file and puts a readable output to the terminal
 
     # Arguments #
     :arg filename: Generic name of the input data file
     :type filename: str
+    :arg provider: the provider the LP file was solved with, 'greatcircle' reads the estimated snapshot, anything else the
+        road distances
+    :type provider: str
     """
-    # Load Dist Matrix, Address data
-    distMatrix = np.load(os.path.join("CachedDistances", filename + ".npy"))
+    # Load Dist Matrix, Address data. N comes from the snapshot header, and the matrix is memory mapped so nothing is read yet
+    snapshot = estimateName(filename) if provider == 'greatcircle' else filename
+    meta = readMatrixMeta(snapshot)
+    if meta is None:
+        raise FileNotFoundError(f'No distance snapshot for {filename}, solve it with the {provider} provider first')
+    distMatrix = loadDistanceMatrix(snapshot)
+    print(f'{filename}: {meta["N"]} locations, distances in {meta["units"]}, for {meta["mode"] or "an unknown mode, from before headers"}')
     df = pd.read_csv(os.path.join(os.getcwd(), 'Data', filename+'.csv'))
     # Pull solution from .sol file
     solution = solParser(distMatrix, filename)
     # Interpret that solution
-    sol = solInterpreter(solution, distMatrix, filename)
+    sol = solInterpreter(solution, distMatrix, filename, df)
+    saveTour(filename, sol, df['Address'].tolist())
     # Graph it
-    ShowMapSolutions(sol, df, TomTomKey, MapBoxKey)
+    ShowMapSolutions(sol, df)
+
+
+# ------------------------------------------------ Batch Processing ------------------------------------------------- #
+
+def runFile(filename:str, method:str='heuristic', key:str=None, render:bool=False, profile:bool=False, cprofile:bool=False,
+            vehicles:int=None, cluster:str='kmeans', capacity:float=None, incremental:bool=False, **cacheArgs) -> dict:
+    """ Runs one data file through the whole pipeline with no questions asked: load, distance matrix, solve, interpret.
+        Everything it prints goes to Logs/<filename>.log. Never raises, a failure is reported in the returned row instead
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+    :arg method: 'lp', 'heuristic' or 'exact', see solve. With 'lp', sol/<filename>.sol is interpreted if there is one
+    :type method: str
+    :arg key: API key needed to call Google Maps if no cached data
+    :type key: str
+    :arg render: Also draw the tour to Maps/<filename>.html
+    :type render: bool
+    :arg profile: Also measure peak memory of every stage, and return the full profiler report
+    :type profile: bool
+    :arg cprofile: Dump a cProfile of every stage to Profiles/<filename>/<stage>.prof
+    :type cprofile: bool
+    :arg vehicles: Split the stops over this many vehicles, see solve
+    :type vehicles: int
+    :arg cluster: 'kmeans' or 'sweep', how stops are split between vehicles
+    :type cluster: str
+    :arg capacity: Most stops, or Demand, one vehicle can take
+    :type capacity: float
+    :arg incremental: Re-plan from the last tour saved for the file, see solve
+    :type incremental: bool
+    :arg cacheArgs: passed on to validateCache
+    :type cacheArgs: dict
+
+    # Returns #
+    :return row: File, N, Method, Vehicles, Status, Length of all routes together, and seconds spent in each stage. With profile or cprofile, the
+        Profiler report is under 'profile'
+    :rtype row: dict
+    """
+    fleet = vehicles is not None or capacity is not None
+    row = {'File': filename, 'N': None, 'Method': method, 'Vehicles': None, 'Status': 'ok', 'Length': np.nan}
+    profiler = Profiler(trace=profile, cprofileDir=os.path.join('Profiles', filename) if cprofile else None)
+    begin = time.perf_counter()
+    os.makedirs('Logs', exist_ok=True)
+    with open(os.path.join('Logs', filename + '.log'), 'w') as log, contextlib.redirect_stdout(log), profiler:
+        try:
+            with profiler.stage('load'):
+                with open(os.path.join('Data', filename + '.csv'), 'r') as data:
+                    df = pd.read_csv(data)
+            row['N'] = len(df)
+            with profiler.stage('distances'):
+                distMatrix = validateCache(filename, df, key, **cacheArgs)
+            previous = previousTour(filename, df) if incremental and not fleet else None
+            routes = None
+            with profiler.stage('solve'):
+                if method == 'lp' and fleet:
+                    raise ValueError('The LP model is a single tour, solve a fleet with the heuristic or exact method')
+                elif fleet:
+                    routes = solveFleet(distMatrix, df[['Latitude', 'Longitude']].to_numpy(), vehicles, cluster, capacity,
+                                        df['Demand'].to_numpy() if 'Demand' in df.columns else None, method=method)
+                elif method == 'lp':
+                    start = None
+                    if previous is not None:
+                        with profiler.stage('repair'):
+                            start = repairTour(distMatrix, previous)
+                    with profiler.stage('constraints'):
+                        constMatrix = generateContraintMatrix(distMatrix)
+                    with profiler.stage('lp'):
+                        lpGenerator(distMatrix, constMatrix, filename, start=start)
+                    if os.path.exists(os.path.join('sol', filename + '.sol')):
+                        with profiler.stage('solParser'):
+                            solution = solParser(distMatrix, filename)
+                        with profiler.stage('solInterpreter'):
+                            routes = solInterpreter(solution, distMatrix, filename, df)
+                elif previous is not None:
+                    with profiler.stage('repair'):
+                        routes = repairTour(distMatrix, previous)
+                elif method == 'heuristic':
+                    routes = solveHeuristic(distMatrix)
+                elif method == 'exact':
+                    routes = solveExact(distMatrix)
+                else:
+                    raise ValueError(f'Unknown solve method "{method}"')
+            with profiler.stage('interpret'):
+                if routes and fleet:
+                    row['Vehicles'] = len(routes)
+                    row['Length'] = fleetInterpreter(routes, distMatrix, df).sum()
+                elif routes:
+                    saveTour(filename, routes, df['Address'].tolist())
+                    row['Vehicles'] = 1
+                    row['Length'] = tourLength(distMatrix, routesToOrder(routes))
+                    print(f'Tour of {len(routes)} locations, total distance {row["Length"]:.2f}')
+                if routes and render:
+                    os.makedirs('Maps', exist_ok=True)
+                    keys = loadKeys()
+                    with profiler.stage('routes'):
+                        if fleet:
+                            legs = [GenerateMapSolutions(vehicle, df, keys.get('TomTom')) for vehicle in routes]
+                        else:
+                            legs = GenerateMapSolutions(routes, df, keys.get('TomTom'))
+                    with profiler.stage('map'):
+                        make_map(legs, df, keys.get('MapBox'), routes, autoOpen=False, name=filename)
+        except Exception as e:
+            print(traceback.format_exc())
+            # Inner stages finish first, so the first failed one is where it actually broke
+            failed = next((record['name'] for record in profiler.stages if record['failed']), 'setup')
+            row['Status'] = f'failed in {failed}: {type(e).__name__}: {e}'
+    for record in profiler.stages:
+        if '/' not in record['name']:
+            row[f"{record['name']} (s)"] = round(record['wall (s)'], 3)
+    row['total (s)'] = round(time.perf_counter() - begin, 3)
+    if profile or cprofile:
+        row['profile'] = profiler.report()
+    return row
+
+
+def batch(pattern:str='Data/*.csv', method:str='heuristic', key:str=None, workers:int=None, summaryPath:str='Summary.csv', render:bool=False, profilePath:str=None, cprofile:bool=False,
+          vehicles:int=None, cluster:str='kmeans', capacity:float=None, incremental:bool=False, **cacheArgs) -> pd.DataFrame:
+    """ Runs every data file matching a glob through runFile, one process per file. The processes share the distance
+        cache, which locks itself while being written. One file failing never stops the others.
+
+    # Arguments #
+    :arg pattern: glob of data files. Only the names are used, the files are always read from Data/
+    :type pattern: str
+    :arg method: 'lp', 'heuristic' or 'exact', see runFile
+    :type method: str
+    :arg key: API key needed to call Google Maps if no cached data
+    :type key: str
+    :arg workers: Number of files run at the same time, defaults to the number of CPUs
+    :type workers: int
+    :arg summaryPath: Where to write the summary table as a CSV
+    :type summaryPath: str
+    :arg render: Also draw every tour to Maps/<filename>.html
+    :type render: bool
+    :arg profilePath: Profile every file, see runFile, and write all of the reports to this JSON file
+    :type profilePath: str
+    :arg cprofile: Dump a cProfile of every stage of every file, see runFile
+    :type cprofile: bool
+    :arg vehicles: Split every file's stops over this many vehicles, see solve
+    :type vehicles: int
+    :arg cluster: 'kmeans' or 'sweep', how stops are split between vehicles
+    :type cluster: str
+    :arg capacity: Most stops, or Demand, one vehicle can take
+    :type capacity: float
+    :arg incremental: Re-plan from the last tour saved for the file, see solve
+    :type incremental: bool
+    :arg cacheArgs: passed on to validateCache
+    :type cacheArgs: dict
+
+    # Returns #
+    :return summary: One row per file from runFile
+    :rtype summary: pd.DataFrame
+    """
+    filenames = sorted({os.path.splitext(os.path.basename(path))[0] for path in glob.glob(pattern)})
+    if not filenames:
+        raise ValueError(f'No data files match "{pattern}"')
+    rows = []
+    profiles = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(runFile, filename, method, key, render, profilePath is not None, cprofile, vehicles, cluster, capacity, incremental, **cacheArgs): filename for filename in filenames}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e:
+                # Only happens if the worker process itself died
+                row = {'File': futures[future], 'Method': method, 'Status': f'failed: {type(e).__name__}: {e}'}
+            print(f"{row['File']}: {row['Status']}")
+            if 'profile' in row:
+                profiles[row['File']] = row.pop('profile')
+            rows.append(row)
+    columns = ['File', 'N', 'Method', 'Vehicles', 'Status', 'Length', 'load (s)', 'distances (s)', 'solve (s)', 'interpret (s)', 'total (s)']
+    summary = pd.DataFrame(rows, columns=columns).sort_values('File').reset_index(drop=True)
+    summary.to_csv(summaryPath, index=False)
+    if profilePath is not None:
+        with open(profilePath, 'w') as f:
+            json.dump({filename: profiles[filename] for filename in sorted(profiles)}, f, indent=1)
+    print(summary.to_string(index=False))
+    return summary
 
 
 # -------------------------------------------------- Define Main ---------------------------------------------------- #
@@ -69,4 +322,28 @@ def main(filename:str,key:str=None) -> None:
         interpret(filename)
 
 if __name__ == "__main__":
-    main(filename=FILENAME, key=Keys['googleMaps'])
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Solve many data files at once. Run with no arguments for the interactive prompt on ' + FILENAME)
+    parser.add_argument('pattern', nargs='?', help='glob of data files, ex. "Data/*.csv"')
+    parser.add_argument('--method', choices=['lp', 'heuristic', 'exact'], default='heuristic')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--summary', default='Summary.csv', help='where to write the summary table')
+    parser.add_argument('--map', action='store_true', help='draw every tour to Maps/<filename>.html')
+    parser.add_argument('--provider', default='directions', help='distance provider for missing pairs, ex. matrix or greatcircle')
+    parser.add_argument('--vehicles', type=int, default=None, help='split the stops over this many vehicles leaving from the first location')
+    parser.add_argument('--cluster', choices=['kmeans', 'sweep'], default='kmeans', help='how stops are split between vehicles')
+    parser.add_argument('--capacity', type=float, default=None, help='most stops, or Demand, one vehicle can take')
+    parser.add_argument('--incremental', action='store_true', help='re-plan from the last saved tour instead of solving from scratch')
+    parser.add_argument('--symmetric', action='store_true', default=None, help='fetch each pair one way only and use it for both')
+    parser.add_argument('--fill', action='store_true', help='fill distances the API failed to return instead of stopping')
+    parser.add_argument('--prefilter', type=int, default=None, help='only fetch routes to each stop\'s k nearest stops')
+    parser.add_argument('--profile', nargs='?', const='Profile.json', default=None, metavar='PATH',
+                        help='write per stage time, peak memory, API calls, and cache hit rates to a JSON report')
+    parser.add_argument('--cprofile', action='store_true', help='also dump a cProfile of every stage to Profiles/<filename>/')
+    args = parser.parse_args()
+    # A missing Keys.json just means every key has to come from the environment
+    key = loadKeys().get('googleMaps')
+    if args.pattern is None:
+        main(filename=FILENAME, key=key)
+    else:
+        batch(args.pattern, args.method, key, args.workers, args.summary, args.map, args.profile, args.cprofile,
+              args.vehicles, args.cluster, args.capacity, args.incremental, provider=args.provider, prefilter=args.prefilter, symmetric=args.symmetric, fill=args.fill)
\ No newline at end of file
@@ -0,0 +1,86 @@
+# Import Statements
+from functools import lru_cache
+import numpy as np
+
+# -------------------------------------- Arc Index -------------------------------------- #
+
+# The route (arc) from i to j is numbered i * N + j, the same as its column in the constraint matrix, and its LP variable
+# is named i{i}j{j}. Names are made once per N as one string array, so writing an LP file or reading a solution back
+# indexes into arrays instead of formatting or parsing a name for every pair.
+
+def arcIndex(i, j, NumElements:int) -> np.ndarray:
+    """ Arc numbers of the routes from i to j, takes scalars or arrays """
+    return np.asarray(i) * NumElements + np.asarray(j)
+
+
+def arcEnds(index, NumElements:int) -> tuple:
+    """ Where the arcs with these numbers start and end, the opposite of arcIndex
+
+    # Returns #
+    :return i: the locations each arc starts from
+    :rtype i: np.ndarray
+    :return j: the locations each arc ends at
+    :rtype j: np.ndarray
+    """
+    return np.divmod(np.asarray(index), NumElements)
+
+
+@lru_cache(maxsize=4)
+def locationNumbers(NumElements:int) -> np.ndarray:
+    """ 0 ... N-1 as strings, exactly as wide as the longest one. Read only, shared by every caller """
+    numbers = np.arange(NumElements).astype(f'U{len(str(max(NumElements - 1, 0)))}')
+    numbers.flags.writeable = False
+    return numbers
+
+
+@lru_cache(maxsize=2)
+def arcNames(NumElements:int) -> np.ndarray:
+    """ Every route variable name, arcNames(N)[i, j] is 'i{i}j{j}'. Made once per N, about 40 MB at N = 1000
+
+    # Arguments #
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+
+    # Returns #
+    :return names: N x N read only string array
+    :rtype names: np.ndarray
+    """
+    numbers = locationNumbers(NumElements)
+    names = np.char.add(np.char.add('i', numbers)[:, None], np.char.add('j', numbers)[None, :])
+    names.flags.writeable = False
+    return names
+
+
+@lru_cache(maxsize=4)
+def subtourNames(NumElements:int) -> np.ndarray:
+    """ Every subtour variable name, subtourNames(N)[i] is 't{i}'. Read only """
+    names = np.char.add('t', locationNumbers(NumElements))
+    names.flags.writeable = False
+    return names
+
+
+def decodeArcs(names, NumElements:int) -> np.ndarray:
+    """ Arc numbers of route variable names, all at once, the opposite of arcNames
+
+    # Arguments #
+    :arg names: variable names, ex. the keys of a parsed solution
+    :type names: iterable
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+
+    # Returns #
+    :return index: the arc number of each name, -1 where it isn't a route between two of the N locations
+    :rtype index: np.ndarray
+    """
+    names = np.asarray(list(names), dtype=str)
+    index = np.full(len(names), -1, dtype=np.int64)
+    if len(names) == 0:
+        return index
+    # 'i12j34' splits into '12', 'j', '34'
+    parts = np.char.partition(np.char.lstrip(names, 'i'), 'j')
+    valid = (np.char.startswith(names, 'i') & (parts[:, 1] == 'j') & np.char.isdigit(parts[:, 0]) & np.char.isdigit(parts[:, 2]))
+    i = parts[valid, 0].astype(np.int64)
+    j = parts[valid, 2].astype(np.int64)
+    inside = (i < NumElements) & (j < NumElements)
+    index[np.flatnonzero(valid)[inside]] = arcIndex(i[inside], j[inside], NumElements)
+    return index
@@ -0,0 +1,550 @@
+# Import Statements
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+import numpy as np
+try:
+    import resource
+except ImportError:
+    # Windows, where peak RSS isn't reported
+    resource = None
+
+# -------------------------------------- Synthetic Instances -------------------------------------- #
+
+def syntheticDistanceMatrix(NumElements:int, seed:int=0) -> np.ndarray:
+    """ Makes a random but reproducible distance matrix, in kilometers, for benchmarking without the Google API
+
+    # Arguments #
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+    :arg seed: seed for the random number generator, so runs can be compared
+    :type seed: int
+
+    # Returns #
+    :return distMatrix: N x N matrix of distances rounded to 0.1 km, with zeros on the diagonal
+    :rtype distMatrix: np.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 5, size=(NumElements, 2))
+    distMatrix = np.sqrt(((points[:, None, :] - points[None, :, :])**2).sum(axis=2))
+    # Roads are never straight lines, and are a little asymmetric
+    distMatrix *= rng.uniform(1.1, 1.4, size=distMatrix.shape)
+    distMatrix = np.round(distMatrix, 1)
+    np.fill_diagonal(distMatrix, 0)
+    return distMatrix
+
+def syntheticTour(NumElements:int, seed:int=0) -> np.ndarray:
+    """ A random circular tour that starts at location 0, as the order locations are visited in """
+    rng = np.random.default_rng(seed)
+    return np.concatenate(([0], rng.permutation(np.arange(1, NumElements))))
+
+def writeSyntheticSol(NumElements:int, path:str, seed:int=0) -> np.ndarray:
+    """ Writes a .sol file laid out like CPLEX's, with every route variable, every subtour variable, and a constraint section
+
+    # Arguments #
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+    :arg path: where to write the file
+    :type path: str
+    :arg seed: seed for the tour, so runs can be compared
+    :type seed: int
+
+    # Returns #
+    :return order: the tour written to the file
+    :rtype order: np.ndarray
+    """
+    order = syntheticTour(NumElements, seed)
+    successor = np.empty(NumElements, dtype=int)
+    successor[order] = np.roll(order, -1)
+    position = np.empty(NumElements, dtype=int)
+    position[order] = np.arange(NumElements)
+    with open(path, 'w') as f:
+        f.write('<?xml version = "1.0" encoding="UTF-8" standalone="yes"?>\n<CPLEXSolution version="1.2">\n')
+        f.write(' <header problemName="synthetic.lp" objectiveValue="0" solutionTypeValue="3" solutionStatusValue="101"/>\n')
+        f.write(' <linearConstraints>\n')
+        f.writelines(f'  <constraint name="c{k + 1}" index="{k}" slack="0"/>\n' for k in range(2 * NumElements))
+        f.write(' </linearConstraints>\n <variables>\n')
+        index = 0
+        for i in range(NumElements):
+            f.writelines(f'  <variable name="i{i}j{j}" index="{index + k}" value="{int(successor[i] == j)}"/>\n'
+                         for k, j in enumerate(j for j in range(NumElements) if j != i))
+            index += NumElements - 1
+        f.writelines(f'  <variable name="t{i}" index="{index + i}" value="{NumElements - position[i]}"/>\n' for i in range(NumElements))
+        f.write(' </variables>\n</CPLEXSolution>\n')
+    return order
+
+def syntheticLocations(NumElements:int, seed:int=0):
+    """ Random named locations scattered over a few kilometers of Austin, as a DataFrame like the ones in Data """
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Name': [f'S{i}' for i in range(NumElements)],
+                         'Address': [f'{i}+Synthetic+St' for i in range(NumElements)],
+                         'Latitude': 30.285 + rng.uniform(-0.02, 0.02, NumElements),
+                         'Longitude': -97.735 + rng.uniform(-0.02, 0.02, NumElements)})
+
+def syntheticLeg(start:tuple, end:tuple, points:int, rng) -> np.ndarray:
+    """ A wiggly, street-like path of (Latitude, Longitude) points between two locations, like TomTom returns """
+    t = np.linspace(0, 1, points)[:, None]
+    path = np.asarray(start) + (np.asarray(end) - np.asarray(start)) * t
+    # Staircase the path like a street grid, plus a little GPS noise
+    path[:, 0] += 0.0008 * np.sign(np.sin(t[:, 0] * 40)) * np.sin(np.pi * t[:, 0])
+    return path + rng.normal(0, 2e-6, path.shape)
+
+def syntheticTomTomResponse(leg:np.ndarray) -> dict:
+    """ Wraps the inside of a leg in the JSON layout of a TomTom routing response, as a stand in for the API """
+    return {'routes': [{'legs': [{'points': [{'latitude': lat, 'longitude': lon} for lat, lon in leg[1:-1].tolist()]}]}]}
+
+# -------------------------------------- Measuring -------------------------------------- #
+
+@contextlib.contextmanager
+def scratch():
+    """ Moves into an empty folder for the length of a with block, for anything that writes files relative to the
+        working directory. The previous working directory is restored before the folder is deleted
+    """
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            yield folder
+        finally:
+            os.chdir(previous)
+
+def peakRSS() -> float:
+    """ Peak resident memory of this process so far in kB, NaN where the platform doesn't report it """
+    if resource is None:
+        return np.nan
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _runCase(target, args:tuple, trace:bool, queue) -> None:
+    """ Runs a single benchmark case inside its own process, so peak RSS belongs to that case only """
+    try:
+        case = target(*args)
+        next(case)
+        rssBefore = peakRSS()
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        next(case, None)
+        wall = time.perf_counter() - start
+        result = {'wall_s': wall}
+        if trace:
+            result['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        rssAfter = peakRSS()
+        result['rss_peak_mb'] = rssAfter / 2**10
+        result['rss_growth_mb'] = (rssAfter - rssBefore) / 2**10
+        case.close()
+    except Exception:
+        result = {'error': traceback.format_exc()}
+    queue.put(result)
+
+def _spawn(target, args:tuple, trace:bool) -> dict:
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_runCase, args=(target, args, trace, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    if 'error' in result:
+        raise RuntimeError(f'Benchmark case {target.__name__}{args} failed:\n{result["error"]}')
+    return result
+
+def measure(target, *args) -> dict:
+    """ Times one case in a fresh process. target(*args) must be a generator that does its setup, yields, does the timed work, then yields again.
+        tracemalloc slows Python down a lot, so the traced peak comes from a second, separate run.
+
+    # Returns #
+    :return result: wall time, process peak RSS, and tracemalloc peak for the timed work
+    :rtype result: dict
+    """
+    result = _spawn(target, args, False)
+    result['traced_peak_mb'] = _spawn(target, args, True)['traced_peak_mb']
+    return result
+
+# -------------------------------------- Cases -------------------------------------- #
+
+def lpWriterCase(NumElements:int, compress:bool=False):
+    """ Writes the LP file for a synthetic instance of size N """
+    from scripts.Modeler import generateContraintMatrix, lpGenerator
+    distMatrix = syntheticDistanceMatrix(NumElements)
+    constMatrix = generateContraintMatrix(distMatrix)
+    with scratch():
+        yield
+        lpGenerator(distMatrix, constMatrix, f'Synthetic{NumElements}', compress=compress)
+        yield
+
+def benchLpWriter(sizes:list, compress:bool=False) -> None:
+    """ Prints wall time and memory for the LP writer at each size """
+    print(f'{"N":>6} {"wall (s)":>10} {"traced peak (MB)":>17} {"RSS peak (MB)":>14} {"RSS growth (MB)":>16}')
+    for NumElements in sizes:
+        result = measure(lpWriterCase, NumElements, compress)
+        print(f'{NumElements:>6} {result["wall_s"]:>10.3f} {result["traced_peak_mb"]:>17.1f} {result["rss_peak_mb"]:>14.1f} {result["rss_growth_mb"]:>16.1f}')
+
+
+def solParserCase(NumElements:int):
+    """ Parses a synthetic .sol file of size N """
+    from scripts.Sol import solParser
+    with scratch():
+        os.mkdir('sol')
+        writeSyntheticSol(NumElements, os.path.join('sol', f'Synthetic{NumElements}.sol'))
+        distMatrix = np.zeros((NumElements, NumElements))
+        yield
+        solParser(distMatrix, f'Synthetic{NumElements}')
+        yield
+
+def benchSolParser(sizes:list) -> None:
+    """ Prints wall time and memory for the .sol parser at each size """
+    print(f'{"N":>6} {"wall (s)":>10} {"traced peak (MB)":>17} {"RSS peak (MB)":>14} {"RSS growth (MB)":>16}')
+    for NumElements in sizes:
+        result = measure(solParserCase, NumElements)
+        print(f'{NumElements:>6} {result["wall_s"]:>10.3f} {result["traced_peak_mb"]:>17.1f} {result["rss_peak_mb"]:>14.1f} {result["rss_growth_mb"]:>16.1f}')
+
+def constraintMatrixCase(NumElements:int):
+    """ Builds the sparse constraint matrix for a synthetic instance of size N """
+    from scripts.Modeler import generateContraintMatrix
+    distMatrix = syntheticDistanceMatrix(NumElements)
+    yield
+    generateContraintMatrix(distMatrix)
+    yield
+
+def solInterpreterCase(NumElements:int):
+    """ Turns a parsed synthetic solution of size N into routes, with its printing thrown away. The locations are
+        handed over already loaded, the way the pipeline calls it """
+    from scripts.Sol import solParser, solInterpreter
+    with scratch():
+        os.mkdir('sol')
+        os.mkdir('Data')
+        writeSyntheticSol(NumElements, os.path.join('sol', f'Synthetic{NumElements}.sol'))
+        locations = syntheticLocations(NumElements)
+        locations.to_csv(os.path.join('Data', f'Synthetic{NumElements}.csv'), index=False)
+        distMatrix = syntheticDistanceMatrix(NumElements)
+        solution = solParser(distMatrix, f'Synthetic{NumElements}')
+        yield
+        with contextlib.redirect_stdout(io.StringIO()):
+            solInterpreter(solution, distMatrix, f'Synthetic{NumElements}', locations)
+        yield
+
+def apiManagerCase(NumElements:int, points:int=300):
+    """ Pulls the points out of N stubbed TomTom responses, one per leg of a synthetic tour """
+    from scripts.Sol import APIMANAGER
+    rng = np.random.default_rng(0)
+    coordinates = syntheticLocations(NumElements)[['Latitude', 'Longitude']].to_numpy()
+    order = syntheticTour(NumElements)
+    responses = [syntheticTomTomResponse(syntheticLeg(coordinates[i], coordinates[j], points, rng)) for i, j in zip(order, np.roll(order, -1))]
+    yield
+    for response in responses:
+        APIMANAGER(response)
+    yield
+
+def mapBuildCase(NumElements:int, points:int=100):
+    """ Draws and saves the map of a synthetic tour of size N with make_map's default settings """
+    from scripts.Sol import make_map
+    from scripts.Solver import orderToRoutes
+    rng = np.random.default_rng(0)
+    locations = syntheticLocations(NumElements)
+    sol = orderToRoutes(syntheticTour(NumElements))
+    coordinates = locations[['Latitude', 'Longitude']].to_numpy()
+    legs = {i: syntheticLeg(coordinates[i], coordinates[j], points, rng) for i, j in sol.items()}
+    with scratch():
+        os.mkdir('Maps')
+        yield
+        make_map(legs, locations, 'token', sol, autoOpen=False)
+        yield
+
+# Every hot path the suite covers, in pipeline order
+SUITE = {
+    'generateContraintMatrix': constraintMatrixCase,
+    'lpGenerator': lpWriterCase,
+    'solParser': solParserCase,
+    'solInterpreter': solInterpreterCase,
+    'APIMANAGER': apiManagerCase,
+    'make_map': mapBuildCase,
+}
+
+def gitCommit() -> tuple:
+    """ The commit the working tree is on, and whether it has uncommitted changes. (None, None) outside of git """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def runSuite(sizes:list, cases:list=None, output:str=None) -> dict:
+    """ Runs every case in SUITE at every size, each in a fresh process, and saves the results as JSON tagged with the
+        commit, so runs on two commits can be put side by side with compareResults. Everything runs offline.
+
+    # Arguments #
+    :arg sizes: values of N to run every case at
+    :type sizes: list
+    :arg cases: names of the cases to run, defaults to all of SUITE
+    :type cases: list
+    :arg output: where to save the results, defaults to BenchmarkResults/<commit>.json
+    :type output: str
+
+    # Returns #
+    :return results: the saved results
+    :rtype results: dict
+    """
+    commit, dirty = gitCommit()
+    results = {'commit': commit, 'dirty': dirty, 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': sys.version.split()[0], 'numpy': np.__version__, 'results': []}
+    print(f'{"case":>24} {"N":>6} {"wall (s)":>10} {"traced peak (MB)":>17} {"RSS peak (MB)":>14}')
+    for name in cases or SUITE:
+        for NumElements in sizes:
+            result = {'case': name, 'N': NumElements, **measure(SUITE[name], NumElements)}
+            results['results'].append(result)
+            print(f'{name:>24} {NumElements:>6} {result["wall_s"]:>10.3f} {result["traced_peak_mb"]:>17.1f} {result["rss_peak_mb"]:>14.1f}')
+    if output is None:
+        output = os.path.join('BenchmarkResults', f'{commit or "results"}{"-dirty" if dirty else ""}.json')
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f'Saved to {output}')
+    return results
+
+def compareResults(before:str, after:str) -> None:
+    """ Prints two saved suite runs side by side, with how many times faster and smaller the second one is """
+    runs = []
+    for path in (before, after):
+        with open(path, 'r') as f:
+            runs.append(json.load(f))
+    old = {(result['case'], result['N']): result for result in runs[0]['results']}
+    print(' -> '.join(f'{run["commit"]}{" (dirty)" if run["dirty"] else ""} {run["date"]}' for run in runs))
+    print(f'{"case":>24} {"N":>6} {"wall (s)":>21} {"speedup":>8} {"traced peak (MB)":>21}')
+    for result in runs[1]['results']:
+        previous = old.get((result['case'], result['N']))
+        if previous is None:
+            continue
+        speedup = previous['wall_s'] / result['wall_s'] if result['wall_s'] else float('inf')
+        print(f'{result["case"]:>24} {result["N"]:>6} {previous["wall_s"]:>10.3f}{result["wall_s"]:>11.3f} {speedup:>7.2f}x'
+              f' {previous["traced_peak_mb"]:>10.1f}{result["traced_peak_mb"]:>11.1f}')
+
+def solveLpFile(path:str, timeLimit:float) -> tuple:
+    """ Solves an LP file with HiGHS, if highspy is installed. HiGHS can't read indicator constraints
+
+    # Returns #
+    :return result: solver seconds and objective, or None and the reason it couldn't solve
+    :rtype result: tuple
+    """
+    try:
+        import highspy
+    except ImportError:
+        return None, 'highspy not installed'
+    solver = highspy.Highs()
+    solver.setOptionValue('output_flag', False)
+    solver.setOptionValue('time_limit', float(timeLimit))
+    if solver.readModel(path) != highspy.HighsStatus.kOk:
+        return None, 'HiGHS could not read it'
+    start = time.perf_counter()
+    solver.run()
+    wall = time.perf_counter() - start
+    return wall, f'{solver.modelStatusToString(solver.getModelStatus())}, objective {solver.getInfo().objective_function_value:.1f}'
+
+def benchFormulations(sizes:list, neighbours:int=8, timeLimit:float=120) -> None:
+    """ Prints file size, write time, and solver time of every LP formulation at each size """
+    from scripts.Modeler import generateContraintMatrix, lpGenerator
+    variants = [('indicator', None), ('mtz', None), ('mtz', neighbours)]
+    print(f'{"N":>5} {"formulation":>16} {"size (kB)":>10} {"write (s)":>10} {"solve (s)":>10}  result')
+    with scratch():
+        for NumElements in sizes:
+            distMatrix = syntheticDistanceMatrix(NumElements)
+            constMatrix = generateContraintMatrix(distMatrix)
+            for formulation, k in variants:
+                start = time.perf_counter()
+                path = lpGenerator(distMatrix, constMatrix, f'Synthetic{NumElements}', formulation=formulation, neighbours=k)
+                write = time.perf_counter() - start
+                solve, result = solveLpFile(path, timeLimit)
+                name = formulation + (f' k={k}' if k else '')
+                solveText = f'{solve:.2f}' if solve is not None else '-'
+                print(f'{NumElements:>5} {name:>16} {os.path.getsize(path) / 1024:>10.1f} {write:>10.3f} {solveText:>10}  {result}')
+
+def benchMap(NumElements:int, points:int=500, tolerance:float=5) -> None:
+    """ Prints file size and build time of the map, drawn the old way and with every size saving turned on """
+    from scripts.Sol import make_map
+    from scripts.Solver import orderToRoutes
+    rng = np.random.default_rng(0)
+    locations = syntheticLocations(NumElements)
+    sol = orderToRoutes(syntheticTour(NumElements))
+    coordinates = locations[['Latitude', 'Longitude']].to_numpy()
+    legs = {i: syntheticLeg(coordinates[i], coordinates[j], points, rng) for i, j in sol.items()}
+    variants = [('every point, trace per leg, inline plotly.js', {}),
+                (f'{tolerance} m, single trace, shared plotly.js', {'tolerance': tolerance, 'singleTrace': True, 'plotlyjs': 'directory'})]
+    print(f'{NumElements} locations, {points} points per leg')
+    with scratch():
+        for name, mapArgs in variants:
+            os.mkdir('Maps')
+            start = time.perf_counter()
+            path = make_map(legs, locations, 'token', sol, autoOpen=False, **mapArgs)
+            wall = time.perf_counter() - start
+            html = os.path.getsize(os.path.join('Maps', 'GeneratedMap.html'))
+            shared = sum(os.path.getsize(os.path.join('Maps', f)) for f in os.listdir('Maps') if f.endswith('.js'))
+            print(f'{name:>46}: {wall:6.2f} s, map {html / 2**20:6.2f} MB' + (f' + {shared / 2**20:.2f} MB plotly.min.js' if shared else ''))
+            for f in os.listdir('Maps'):
+                os.remove(os.path.join('Maps', f))
+            os.rmdir('Maps')
+
+def benchGreatCircle(sizes:list, neighbours:int=10) -> None:
+    """ Prints how long the offline great circle matrix, and picking the k nearest routes to fetch, take """
+    from scripts.Modeler import greatCircleMatrix, nearestArcs
+    for NumElements in sizes:
+        locations = syntheticLocations(NumElements)
+        start = time.perf_counter()
+        estimate = greatCircleMatrix(locations, detour=1.3)
+        matrix = time.perf_counter() - start
+        start = time.perf_counter()
+        arcs = nearestArcs(estimate, neighbours)
+        prefilter = time.perf_counter() - start
+        print(f'N={NumElements:>5}: matrix {matrix:6.3f} s, {neighbours} nearest {prefilter:6.3f} s, '
+              f'{int(arcs.sum())} of {NumElements * (NumElements - 1)} routes left to fetch')
+
+def benchFleet(sizes:list, vehicles:int=5, timeLimit:float=120, mipLimit:int=40) -> None:
+    """ Prints how long splitting the stops over vehicles and solving each one's tour takes, next to one tour over every
+        stop, from the heuristic and, up to mipLimit locations, from HiGHS on the whole MTZ model
+    """
+    from scripts.Fleet import fleetLength, solveFleet
+    from scripts.Modeler import generateContraintMatrix, greatCircleMatrix, lpGenerator
+    from scripts.Solver import routesToOrder, solveHeuristic, tourLength
+    print(f'{"N":>5} {"solve":>22} {"time (s)":>9} {"length":>9}  result')
+    with scratch():
+        for NumElements in sizes:
+            locations = syntheticLocations(NumElements)
+            distMatrix = greatCircleMatrix(locations, detour=1.3)
+            coordinates = locations[['Latitude', 'Longitude']].to_numpy()
+            rows = []
+            start = time.perf_counter()
+            routes = solveHeuristic(distMatrix)
+            rows.append(('one tour, heuristic', time.perf_counter() - start, tourLength(distMatrix, routesToOrder(routes)), ''))
+            if NumElements <= mipLimit:
+                constMatrix = generateContraintMatrix(distMatrix)
+                path = lpGenerator(distMatrix, constMatrix, f'Synthetic{NumElements}', formulation='mtz')
+                solve, result = solveLpFile(path, timeLimit)
+                rows.append(('one tour, MTZ MIP', solve, np.nan, result))
+            for cluster in ('kmeans', 'sweep'):
+                for method in ('heuristic', 'exact'):
+                    start = time.perf_counter()
+                    try:
+                        fleet = solveFleet(distMatrix, coordinates, vehicles, cluster, method=method)
+                    except ValueError as e:
+                        # Held-Karp refuses vehicles with too many stops
+                        rows.append((f'{vehicles} x {cluster}, {method}', None, np.nan, str(e)))
+                        continue
+                    lengths = fleetLength(distMatrix, fleet)
+                    rows.append((f'{vehicles} x {cluster}, {method}', time.perf_counter() - start, lengths.sum(),
+                                 f'{min(len(routes) for routes in fleet) - 1} to {max(len(routes) for routes in fleet) - 1} stops each'))
+            for name, seconds, length, result in rows:
+                secondsText = f'{seconds:.3f}' if seconds is not None else '-'
+                print(f'{NumElements:>5} {name:>22} {secondsText:>9} {length:>9.2f}  {result}')
+
+def benchRepair(NumElements:int=300, edits:list=(1, 5, 20), repeats:int=5) -> None:
+    """ Prints how long re-planning a tour takes after removing and adding stops, next to solving it again from scratch.
+        Each edit removes that many stops from the old tour and adds as many new ones
+    """
+    from scripts.Solver import repairTour, routesToOrder, solveHeuristic, tourLength
+    # The last locations of a bigger site stand in for the added stops
+    distMatrix = syntheticDistanceMatrix(NumElements + max(edits))
+    rng = np.random.default_rng(0)
+    old = routesToOrder(solveHeuristic(distMatrix[:NumElements, :NumElements]))
+    print(f'{"N":>5} {"edit":>12} {"repair (ms)":>12} {"length":>9} {"scratch (ms)":>13} {"length":>9}')
+    for edit in edits:
+        removed = rng.choice(np.arange(1, NumElements), edit, replace=False)
+        locations = np.concatenate((np.setdiff1d(np.arange(NumElements), removed), np.arange(NumElements, NumElements + edit)))
+        current = distMatrix[np.ix_(locations, locations)]
+        # Old location numbers to new ones, removed stops become -1
+        renumber = np.full(NumElements + edit, -1)
+        renumber[locations] = np.arange(len(locations))
+        previous = renumber[old]
+        timings = {}
+        for name, solver in (('repair', lambda: repairTour(current, previous)), ('scratch', lambda: solveHeuristic(current))):
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                routes = solver()
+                best = min(best or np.inf, time.perf_counter() - start)
+            timings[name] = (best * 1000, tourLength(current, routesToOrder(routes)))
+        print(f'{NumElements:>5} {f"-{edit} +{edit}":>12} {timings["repair"][0]:>12.2f} {timings["repair"][1]:>9.1f} '
+              f'{timings["scratch"][0]:>13.2f} {timings["scratch"][1]:>9.1f}')
+
+def benchImports(modules:list, repeats:int=5, heavy:tuple=('pandas', 'scipy', 'requests', 'plotly', 'bs4')) -> None:
+    """ Prints how long each module takes to import in a fresh interpreter, from python -X importtime, and which of the
+        heavy dependencies it pulls in. Best of repeats, since the first run also pays for a cold disk cache
+    """
+    for module in modules:
+        best = None
+        for _ in range(repeats):
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True, check=True)
+            # The last line is the module itself, with the cumulative time in microseconds
+            cumulative = int(result.stderr.strip().splitlines()[-1].split('|')[1])
+            best = cumulative if best is None else min(best, cumulative)
+        loaded = {line.split('|')[2].strip() for line in result.stderr.splitlines()[1:]}
+        print(f'{module:>18}: {best / 1000:7.1f} ms, loads {", ".join(name for name in heavy if name in loaded) or "nothing heavy"}')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks for the routing pipeline, run from the repository root')
+    subparsers = parser.add_subparsers(dest='case', required=True)
+    lp = subparsers.add_parser('lp', help='LP file writer')
+    lp.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 500])
+    lp.add_argument('--compress', action='store_true')
+    sol = subparsers.add_parser('sol', help='.sol file parser')
+    sol.add_argument('--sizes', type=int, nargs='+', default=[300])
+    formulations = subparsers.add_parser('formulations', help='LP formulations, with solve times from HiGHS if highspy is installed')
+    formulations.add_argument('--sizes', type=int, nargs='+', default=[10, 20, 30])
+    formulations.add_argument('--neighbours', type=int, default=8)
+    formulations.add_argument('--time-limit', type=float, default=120)
+    mapCase = subparsers.add_parser('map', help='map building')
+    mapCase.add_argument('--size', type=int, default=200)
+    mapCase.add_argument('--points', type=int, default=500)
+    mapCase.add_argument('--tolerance', type=float, default=5)
+    greatCircle = subparsers.add_parser('greatcircle', help='offline distance estimates and the nearest neighbour prefilter')
+    greatCircle.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000])
+    greatCircle.add_argument('--neighbours', type=int, default=10)
+    fleet = subparsers.add_parser('fleet', help='several vehicles, each solved on its own, against one tour over every stop')
+    fleet.add_argument('--sizes', type=int, nargs='+', default=[30, 200, 1000])
+    fleet.add_argument('--vehicles', type=int, default=5)
+    fleet.add_argument('--time-limit', type=float, default=120)
+    fleet.add_argument('--mip-limit', type=int, default=40, help='largest N to also solve as one MIP with HiGHS')
+    repair = subparsers.add_parser('repair', help='re-planning after stops are added and removed, against solving from scratch')
+    repair.add_argument('--size', type=int, default=300)
+    repair.add_argument('--edits', type=int, nargs='+', default=[1, 5, 20])
+    imports = subparsers.add_parser('imports', help='import time of each module, run from the repository root')
+    imports.add_argument('--modules', nargs='+', default=['scripts.Solver', 'scripts.Modeler', 'scripts.Sol', 'main'])
+    imports.add_argument('--repeats', type=int, default=5)
+    suite = subparsers.add_parser('suite', help='every hot path at every size, saved as JSON tagged with the commit')
+    suite.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    suite.add_argument('--cases', nargs='+', choices=list(SUITE), default=None)
+    suite.add_argument('--output', default=None, help='defaults to BenchmarkResults/<commit>.json')
+    compare = subparsers.add_parser('compare', help='put two saved suite runs side by side')
+    compare.add_argument('before')
+    compare.add_argument('after')
+    args = parser.parse_args()
+    if args.case == 'lp':
+        benchLpWriter(args.sizes, args.compress)
+    elif args.case == 'sol':
+        benchSolParser(args.sizes)
+    elif args.case == 'formulations':
+        benchFormulations(args.sizes, args.neighbours, args.time_limit)
+    elif args.case == 'map':
+        benchMap(args.size, args.points, args.tolerance)
+    elif args.case == 'greatcircle':
+        benchGreatCircle(args.sizes, args.neighbours)
+    elif args.case == 'fleet':
+        benchFleet(args.sizes, args.vehicles, args.time_limit, args.mip_limit)
+    elif args.case == 'repair':
+        benchRepair(args.size, args.edits)
+    elif args.case == 'imports':
+        benchImports(args.modules, args.repeats)
+    elif args.case == 'suite':
+        runSuite(args.sizes, args.cases, args.output)
+    elif args.case == 'compare':
+        compareResults(args.before, args.after)
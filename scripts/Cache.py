@@ -0,0 +1,450 @@
+# Import Statements
+import argparse
+import contextlib
+from collections import deque
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+from scripts.Profiler import count
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_PATH = os.path.join("CachedDistances", "Pairs.sqlite")
+
+# -------------------------------------- File Locking -------------------------------------- #
+
+@contextlib.contextmanager
+def fileLock(path:str):
+    """ Holds an exclusive lock on <path>.lock for the length of a with block, so processes sharing a cache take turns
+        writing to it. Blocks until the lock is free.
+
+    # Arguments #
+    :arg path: File to guard, the lock file is made next to it
+    :type path: str
+    """
+    with open(path + '.lock', 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK only retries for 10 seconds before giving up, so keep asking
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# -------------------------------------- Pairwise Distance Cache -------------------------------------- #
+
+def normalizeAddress(address:str) -> str:
+    """ Puts an address in one canonical form, so '305+E+23rd+St' and '305 E 23rd St' share a cache entry """
+    return ' '.join(str(address).replace('+', ' ').split()).lower()
+
+
+def pairKey(origin:str, destination:str, mode:str) -> bytes:
+    """ Content address of one route, the SHA-1 of its normalized origin, destination, and travel mode
+
+    # Arguments #
+    :arg origin: Address the route starts from
+    :type origin: str
+    :arg destination: Address the route ends at
+    :type destination: str
+    :arg mode: Mode of travel, so bike and car distances never mix
+    :type mode: str
+
+    # Returns #
+    :return key: 20 byte digest
+    :rtype key: bytes
+    """
+    return hashlib.sha1(f'{normalizeAddress(origin)}\x1f{normalizeAddress(destination)}\x1f{mode.lower()}'.encode()).digest()
+
+
+class PairCache:
+    """ SQLite store of single route distances keyed on pairKey. Any matrix whose pairs have all been seen before
+        can be built with no API calls, no matter which file or order the addresses came from.
+
+    # Arguments #
+    :arg path: Where the database lives, made if it doesn't exist
+    :type path: str
+    """
+    # SQLite limits how many parameters one statement can take
+    CHUNK = 500
+
+    def __init__(self, path:str=CACHE_PATH):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        # Write ahead logging lets other processes keep reading while one writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS pairs (key BLOB PRIMARY KEY, distance REAL NOT NULL, used REAL NOT NULL) WITHOUT ROWID')
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def lookup(self, keys:list) -> np.ndarray:
+        """ Looks up many pairs at once
+
+        # Arguments #
+        :arg keys: pairKey digests
+        :type keys: list
+
+        # Returns #
+        :return distances: one distance per key, NaN where the pair has never been fetched
+        :rtype distances: np.ndarray
+        """
+        found = {}
+        for start in range(0, len(keys), self.CHUNK):
+            chunk = keys[start:start + self.CHUNK]
+            found.update(self.connection.execute(
+                f'SELECT key, distance FROM pairs WHERE key IN ({",".join("?" * len(chunk))})', chunk).fetchall())
+        distances = np.array([found.get(key, np.nan) for key in keys], dtype=float)
+        # Remember when each pair was last used, so compact can drop the ones nobody needs anymore
+        now = time.time()
+        with fileLock(self.path):
+            self.connection.executemany('UPDATE pairs SET used = ? WHERE key = ?', ((now, key) for key in found))
+            self.connection.commit()
+        hits = int(np.count_nonzero(~np.isnan(distances)))
+        self.hits += hits
+        self.misses += len(keys) - hits
+        count('pair cache hits', hits)
+        count('pair cache misses', len(keys) - hits)
+        return distances
+
+    def store(self, keys:list, distances:np.ndarray) -> None:
+        """ Saves fetched distances, skipping any NaNs so failed calls get retried next time
+
+        # Arguments #
+        :arg keys: pairKey digests
+        :type keys: list
+        :arg distances: one distance per key
+        :type distances: np.ndarray
+        """
+        now = time.time()
+        with fileLock(self.path):
+            self.connection.executemany('INSERT OR REPLACE INTO pairs VALUES (?, ?, ?)',
+                                        ((key, float(value), now) for key, value in zip(keys, distances) if np.isfinite(value)))
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """ Size of the store, and hit/miss counts since it was opened """
+        entries = self.connection.execute('SELECT COUNT(*) FROM pairs').fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses, 'bytes': os.path.getsize(self.path)}
+
+    def compact(self, maxAgeDays:float=None, maxEntries:int=None) -> int:
+        """ Evicts pairs not used for maxAgeDays, then the least recently used past maxEntries, and shrinks the file
+
+        # Arguments #
+        :arg maxAgeDays: drop pairs that haven't been looked up or stored for this many days
+        :type maxAgeDays: float
+        :arg maxEntries: keep at most this many of the most recently used pairs
+        :type maxEntries: int
+
+        # Returns #
+        :return removed: how many pairs were evicted
+        :rtype removed: int
+        """
+        removed = 0
+        with fileLock(self.path):
+            if maxAgeDays is not None:
+                removed += self.connection.execute('DELETE FROM pairs WHERE used < ?', (time.time() - maxAgeDays * 86400,)).rowcount
+            if maxEntries is not None:
+                removed += self.connection.execute(
+                    'DELETE FROM pairs WHERE key NOT IN (SELECT key FROM pairs ORDER BY used DESC LIMIT ?)', (maxEntries,)).rowcount
+            self.connection.commit()
+            self.connection.execute('VACUUM')
+        return removed
+
+
+# -------------------------------------- Geocode Cache -------------------------------------- #
+
+GEOCODE_PATH = os.path.join("CachedDistances", "Geocodes.sqlite")
+
+
+class GeocodeCache:
+    """ SQLite store of every candidate a geocoder returned for an address, keyed on normalizeAddress. The candidates
+        are kept rather than the one picked, so a different disambiguation policy can be run again with no API calls.
+
+    # Arguments #
+    :arg path: Where the database lives, made if it doesn't exist
+    :type path: str
+    """
+    CHUNK = PairCache.CHUNK
+
+    def __init__(self, path:str=GEOCODE_PATH):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS geocodes (address TEXT PRIMARY KEY, results TEXT NOT NULL, used REAL NOT NULL) WITHOUT ROWID')
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def lookup(self, addresses:list) -> dict:
+        """ Looks up many addresses at once
+
+        # Arguments #
+        :arg addresses: Addresses in any form, they are normalized before the lookup
+        :type addresses: list
+
+        # Returns #
+        :return found: each address that has been geocoded before, mapped to its list of candidates
+        :rtype found: dict
+        """
+        keys = {normalizeAddress(address): address for address in addresses}
+        names = list(keys)
+        rows = []
+        for start in range(0, len(names), self.CHUNK):
+            chunk = names[start:start + self.CHUNK]
+            rows += self.connection.execute(
+                f'SELECT address, results FROM geocodes WHERE address IN ({",".join("?" * len(chunk))})', chunk).fetchall()
+        now = time.time()
+        with fileLock(self.path):
+            self.connection.executemany('UPDATE geocodes SET used = ? WHERE address = ?', ((now, name) for name, _ in rows))
+            self.connection.commit()
+        self.hits += len(rows)
+        self.misses += len(names) - len(rows)
+        count('geocode cache hits', len(rows))
+        count('geocode cache misses', len(names) - len(rows))
+        return {keys[name]: json.loads(results) for name, results in rows}
+
+    def store(self, found:dict) -> None:
+        """ Saves the candidates of newly geocoded addresses
+
+        # Arguments #
+        :arg found: each address mapped to its list of candidates
+        :type found: dict
+        """
+        now = time.time()
+        with fileLock(self.path):
+            self.connection.executemany('INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?)',
+                                        ((normalizeAddress(address), json.dumps(results), now) for address, results in found.items()))
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """ Size of the store, and hit/miss counts since it was opened """
+        entries = self.connection.execute('SELECT COUNT(*) FROM geocodes').fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses, 'bytes': os.path.getsize(self.path)}
+
+
+# -------------------------------------- Matrix Snapshots -------------------------------------- #
+
+SNAPSHOT_DIR = "CachedDistances"
+# Storage formats for snapshots, and the units each one holds
+DTYPES = {'float64': 'km', 'float32': 'km', 'uint32': 'm'}
+# uint32 has no NaN, so a missing route is stored as the largest value
+UINT32_MISSING = np.iinfo(np.uint32).max
+
+
+def sourceHash(addresses:list, mode:str) -> str:
+    """ Hash of the exact, ordered set of addresses and the travel mode a matrix was built from """
+    digest = hashlib.sha1(mode.lower().encode())
+    for address in addresses:
+        digest.update(b'\x1e' + normalizeAddress(address).encode())
+    return digest.hexdigest()
+
+
+def snapshotPaths(filename:str) -> tuple:
+    """ Where the matrix and its sidecar header live for a data file """
+    name = os.path.splitext(filename)[0]
+    return os.path.join(os.getcwd(), SNAPSHOT_DIR, name + ".npy"), os.path.join(os.getcwd(), SNAPSHOT_DIR, name + ".json")
+
+
+def estimateName(filename:str) -> str:
+    """ Snapshot name for the great circle estimates of a data file, kept apart so they never replace its road distances """
+    return os.path.splitext(filename)[0] + "-greatcircle"
+
+
+def saveDistanceMatrix(filename:str, distMatrix:np.ndarray, mode:str, source:str, dtype:str='float64') -> dict:
+    """ Saves a matrix snapshot, plus a sidecar header so N, units, and where it came from can be read without the data
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+    :arg distMatrix: N x N distances in kilometers
+    :type distMatrix: np.ndarray
+    :arg mode: Mode of travel the distances are for
+    :type mode: str
+    :arg source: sourceHash of the addresses the matrix was built from
+    :type source: str
+    :arg dtype: storage format, one of DTYPES. uint32 stores whole meters
+    :type dtype: str
+
+    # Returns #
+    :return meta: the header that was written
+    :rtype meta: dict
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f'Unknown snapshot dtype "{dtype}", pick one of {list(DTYPES)}')
+    matrixPath, metaPath = snapshotPaths(filename)
+    if dtype == 'uint32':
+        stored = np.where(np.isfinite(distMatrix), np.round(distMatrix * 1000), UINT32_MISSING).astype(np.uint32)
+    else:
+        stored = distMatrix.astype(dtype)
+    meta = {'N': len(distMatrix), 'units': DTYPES[dtype], 'dtype': dtype, 'mode': mode, 'source': source, 'layout': 'origin-row'}
+    # Write next to the old files then swap them in, so a process that has the old snapshot mapped never sees half a file.
+    # The lock keeps two processes saving the same snapshot from sharing the temporary files
+    with fileLock(matrixPath):
+        with open(matrixPath + '.tmp', 'wb') as f:
+            np.save(f, stored)
+        with open(metaPath + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(matrixPath + '.tmp', matrixPath)
+        os.replace(metaPath + '.tmp', metaPath)
+    return meta
+
+
+def readMatrixMeta(filename:str) -> dict:
+    """ Reads the sidecar header of a snapshot. Snapshots from before headers existed get one made up from the .npy header alone
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+
+    # Returns #
+    :return meta: N, units, dtype, mode, source hash, and layout. None if there is no snapshot at all
+    :rtype meta: dict
+    """
+    matrixPath, metaPath = snapshotPaths(filename)
+    if os.path.exists(metaPath):
+        with open(metaPath, 'r') as f:
+            return json.load(f)
+    if os.path.exists(matrixPath):
+        # Opening with mmap only reads the .npy header
+        legacy = np.load(matrixPath, mmap_mode='r')
+        return {'N': legacy.shape[0], 'units': 'km', 'dtype': str(legacy.dtype), 'mode': None, 'source': None, 'layout': 'legacy'}
+    return None
+
+
+def loadDistanceMatrix(filename:str, mmap_mode:str='r') -> np.ndarray:
+    """ Opens a snapshot, memory mapped by default so it opens instantly and worker processes share the same pages
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+    :arg mmap_mode: passed to np.load, None reads the whole matrix into memory
+    :type mmap_mode: str
+
+    # Returns #
+    :return distMatrix: the matrix as stored, in the units and dtype its header says
+    :rtype distMatrix: np.ndarray
+    """
+    return np.load(snapshotPaths(filename)[0], mmap_mode=mmap_mode)
+
+# -------------------------------------- Saved Tours -------------------------------------- #
+
+TOUR_DIR = "Tours"
+
+
+def tourPath(filename:str) -> str:
+    """ Where the last tour of a data file is saved """
+    return os.path.join(os.getcwd(), TOUR_DIR, os.path.splitext(filename)[0] + ".json")
+
+
+def saveTour(filename:str, routes:dict, addresses:list) -> None:
+    """ Saves a tour as a successor array, next to the addresses it is numbered by, so it can be picked back up after
+        stops are added to or removed from the data file
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+    :arg routes: Each location mapped to the one visited after it
+    :type routes: dict
+    :arg addresses: Address of every location, in the order of the data file
+    :type addresses: list
+    """
+    successor = [-1] * len(addresses)
+    for i, j in routes.items():
+        successor[i] = j
+    path = tourPath(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with fileLock(path):
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'addresses': [normalizeAddress(address) for address in addresses], 'successor': successor}, f)
+        os.replace(path + '.tmp', path)
+
+
+def loadTour(filename:str, addresses:list) -> np.ndarray:
+    """ Reads the saved tour of a data file and renumbers it for the addresses the file has now
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+    :arg addresses: Address of every location, in the order of the data file now
+    :type addresses: list
+
+    # Returns #
+    :return order: The saved tour in the order it is driven, as current location numbers, with -1 for stops that have
+        since been removed. Subtours are strung one after the other. None if no tour has been saved
+    :rtype order: np.ndarray
+    """
+    # Imported here, the solver isn't needed for anything else the cache does
+    from scripts.Solver import successorCycles
+    path = tourPath(filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    current = {}
+    for i, address in enumerate(addresses):
+        current.setdefault(normalizeAddress(address), deque()).append(i)
+    # The same address can be in a file more than once. Its saved rows take its current rows in file order, so an
+    # unchanged file maps straight back onto itself, whatever order the tour happens to visit them in
+    renumber = np.full(len(saved['addresses']), -1, dtype=np.int64)
+    for i, address in enumerate(saved['addresses']):
+        if current.get(address):
+            renumber[i] = current[address].popleft()
+    cycles, _ = successorCycles(np.array(saved['successor'], dtype=np.int64))
+    order = np.concatenate(cycles) if cycles else np.empty(0, dtype=np.int64)
+    return renumber[order]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect or compact the pairwise distance cache')
+    parser.add_argument('command', choices=['stats', 'compact'])
+    parser.add_argument('--path', default=CACHE_PATH)
+    parser.add_argument('--max-age-days', type=float, default=None)
+    parser.add_argument('--max-entries', type=int, default=None)
+    args = parser.parse_args()
+    with PairCache(args.path) as cache:
+        if args.command == 'compact':
+            print(f'Evicted {cache.compact(args.max_age_days, args.max_entries)} pairs')
+        print(cache.stats())
@@ -1,60 +1,214 @@
-import pandas as pd
-import numpy as np
-import requests
+import argparse
 import os
-import json
-
-FILENAME = 'AddressesFull'
-
-def MultipleResultsHandler(response:dict) -> int:
-    location = response["summary"]["query"]
-    print(f"There were multiple results querying for {location}, please select an option.\n------------------------------------------------------------------------------------")
-    for index,item in enumerate(response["results"]):
-        item_address = item["address"]["freeformAddress"]
-        print(f"{index}) {item_address}")
-        
-    print("------------------------------------------------------------------------------------")
-    selection = -1
-    while (selection not in range(response["summary"]["numResults"])):
-        selection = input("Please select an option from the ones given above: ")
-        try:
-            selection = int(selection)
-        except ValueError:
-            print("Please enter a valid digit from the given options.")
-    return int(selection)
-    
-
-def PopulateDataframe(df:pd.DataFrame,apiKey:str,pickFirst:bool=False) -> pd.DataFrame:
-    assert 'Address' in df.columns, 'Ensure that the Dataframe provided contains a column called "Name".'
-    df["Latitude"] = np.nan
-    df["Longitude"] = np.nan
-    for i in range(len(df)):
-        location = df.iloc[i]["Address"]
-        if pickFirst:
-            response = requests.get(f"https://api.tomtom.com/search/2/geocode/{location}.json?limit=1&key={apiKey}").json()
-        else:
-            response = requests.get(f"https://api.tomtom.com/search/2/geocode/{location}.json?key={apiKey}").json()
-        assert response["summary"]["numResults"] > 0, f"There were no results returned after querying for {location}, are you sure that's a valid location?"
-        if (response["summary"]["numResults"] > 1):
-            selection = MultipleResultsHandler(response)
-            df.at[i,"Latitude"] = response["results"][selection]["position"]["lat"]
-            df.at[i,"Longitude"] = response["results"][selection]["position"]["lon"]
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+import numpy as np
+from scripts.Cache import GEOCODE_PATH, GeocodeCache
+from scripts.Network import RateLimiter, makeSession, getJSON, loadKeys
+
+GEOCODE_URL = 'https://api.tomtom.com/search/2/geocode'
+EARTH_RADIUS = 6371.0088
+
+# -------------------------------------- Geometry -------------------------------------- #
+
+def greatCircle(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """ Haversine distance in kilometers between points given in degrees. Takes scalars or arrays that broadcast together
+
+    # Arguments #
+    :arg lat1: Latitude of the first points
+    :type lat1: np.ndarray
+    :arg lon1: Longitude of the first points
+    :type lon1: np.ndarray
+    :arg lat2: Latitude of the second points
+    :type lat2: np.ndarray
+    :arg lon2: Longitude of the second points
+    :type lon2: np.ndarray
+
+    # Returns #
+    :return: Distances in kilometers, shaped like the broadcast inputs
+    :rtype: np.ndarray
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(h, 1)))
+
+# -------------------------------------- Geocoding -------------------------------------- #
+
+def geocodeAddress(address:str, apiKey:str, session=None, limiter:RateLimiter=None, retries:int=5, limit:int=10, url:str=GEOCODE_URL) -> list:
+    """ Asks TomTom for every place an address could be
+
+    # Arguments #
+    :arg address: Address to look up
+    :type address: str
+    :arg apiKey: apiKey for TomTom
+    :type apiKey: str
+    :arg session: Session to reuse, one is made if not given
+    :type session: requests.Session
+    :arg limiter: Shared rate limiter across threads
+    :type limiter: RateLimiter
+    :arg retries: How many times to retry a failed call before giving up
+    :type retries: int
+    :arg limit: Most candidates to ask for
+    :type limit: int
+    :arg url: Geocoding endpoint, only changed to point at a test server
+    :type url: str
+
+    # Returns #
+    :return: Candidates as {'lat', 'lon', 'address'} dictionaries, best match first. Empty if nothing was found
+    :rtype: list
+    """
+    if session is None:
+        session = makeSession(1)
+    response = getJSON(session, f'{url}/{quote(str(address), safe="+,")}.json?limit={limit}&key={apiKey}', limiter, retries)
+    return [{'lat': item['position']['lat'], 'lon': item['position']['lon'], 'address': item['address']['freeformAddress']}
+            for item in response['results']]
+
+
+def pickResult(results:list, reference:tuple=None, spread:float=0.25) -> tuple:
+    """ Picks one candidate without asking anyone. The top result, or the one nearest reference when given
+
+    # Arguments #
+    :arg results: Candidates from geocodeAddress
+    :type results: list
+    :arg reference: (Latitude, Longitude) the addresses should be near, ex. the middle of campus
+    :type reference: tuple
+    :arg spread: Kilometers the candidates may be apart before the pick is flagged for review
+    :type spread: float
+
+    # Returns #
+    :return: Index of the pick, and whether it was ambiguous. Index is None when there are no candidates
+    :rtype: tuple
+    """
+    if not results:
+        return None, False
+    lat = np.array([item['lat'] for item in results])
+    lon = np.array([item['lon'] for item in results])
+    selection = 0 if reference is None else int(np.argmin(greatCircle(reference[0], reference[1], lat, lon)))
+    # Candidates all on the same block are the same place as far as routing cares
+    ambiguous = bool(np.max(greatCircle(lat[selection], lon[selection], lat, lon)) > spread)
+    return selection, ambiguous
+
+
+def PopulateDataframe(df:'pd.DataFrame', apiKey:str, pickFirst:bool=False, reference:tuple=None, spread:float=0.25,
+                      workers:int=8, rateLimit:float=5, retries:int=5, cachePath:str=GEOCODE_PATH, url:str=GEOCODE_URL) -> tuple:
+    """ Fills in Latitude and Longitude for every Address. Each distinct address is looked up once, from the cache if it
+        has been seen before, otherwise in parallel over one pooled session. Nothing ever stops to ask, rows with no
+        result or with far apart candidates come back in a review table instead.
+
+    # Arguments #
+    :arg df: Dataframe with an Address column
+    :type df: pd.DataFrame
+    :arg apiKey: apiKey for TomTom
+    :type apiKey: str
+    :arg pickFirst: Always take the top result and never flag a row for review
+    :type pickFirst: bool
+    :arg reference: (Latitude, Longitude) to pick the nearest candidate to, instead of the top one
+    :type reference: tuple
+    :arg spread: Kilometers the candidates may be apart before a row is flagged for review
+    :type spread: float
+    :arg workers: Number of addresses looked up at the same time
+    :type workers: int
+    :arg rateLimit: Maximum calls per second to TomTom, across all threads
+    :type rateLimit: float
+    :arg retries: How many times to retry a failed call before giving up
+    :type retries: int
+    :arg cachePath: Where the geocode cache lives
+    :type cachePath: str
+    :arg url: Geocoding endpoint, only changed to point at a test server
+    :type url: str
+
+    # Returns #
+    :return: The dataframe with coordinates, and a review table of the rows a person should check
+    :rtype: tuple
+    """
+    import pandas as pd
+    assert 'Address' in df.columns, 'Ensure that the Dataframe provided contains a column called "Address".'
+    addresses = list(dict.fromkeys(df['Address']))
+    with GeocodeCache(cachePath) as cache:
+        found = cache.lookup(addresses)
+        missing = [address for address in addresses if address not in found]
+        print(f'{len(found)} of {len(addresses)} addresses cached, geocoding {len(missing)}')
+        fetched, failed = {}, {}
+        if missing:
+            session = makeSession(workers)
+            limiter = RateLimiter(rateLimit)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(geocodeAddress, address, apiKey, session, limiter, retries, url=url): address for address in missing}
+                for future in as_completed(futures):
+                    try:
+                        fetched[futures[future]] = future.result()
+                    except Exception as e:
+                        # One bad address shouldn't lose the rest, it's left blank and sent to review
+                        failed[futures[future]] = str(e)
+            session.close()
+            cache.store(fetched)
+    found.update(fetched)
+
+    df = df.copy()
+    df['Latitude'] = np.nan
+    df['Longitude'] = np.nan
+    review = []
+    for row, address in enumerate(df['Address']):
+        results = found.get(address, [])
+        selection, ambiguous = pickResult(results, reference, spread)
+        if selection is not None:
+            df.iloc[row, df.columns.get_loc('Latitude')] = results[selection]['lat']
+            df.iloc[row, df.columns.get_loc('Longitude')] = results[selection]['lon']
+        if address in failed:
+            reason = f'lookup failed: {failed[address]}'
+        elif selection is None:
+            reason = 'no results'
+        elif ambiguous and not pickFirst:
+            reason = f'{len(results)} candidates over {spread} km apart'
         else:
-            df.at[i,"Latitude"] = response["results"][0]["position"]["lat"]
-            df.at[i,"Longitude"] = response["results"][0]["position"]["lon"]
-    # Overwrite old file and return DataFrame
-    path = os.path.join(os.getcwd(),'Data',FILENAME+'.csv')
-    if os.path.exists(path):
-        os.remove(path)
-    df.to_csv(path, index='False')
-    return df
+            continue
+        review.append({'Row': row, 'Address': address, 'Reason': reason,
+                       'Picked': results[selection]['address'] if selection is not None else '',
+                       'Candidates': ' | '.join(f"{item['address']} ({item['lat']}, {item['lon']})" for item in results)})
+    return df, pd.DataFrame(review, columns=['Row', 'Address', 'Reason', 'Picked', 'Candidates'])
 
-df = pd.read_csv(os.path.join(os.getcwd(),'Data',FILENAME+'.csv'))
-print(df)
 
+def geocodeFile(filename:str, apiKey:str, **geocodeArgs) -> 'pd.DataFrame':
+    """ Geocodes Data/<filename>.csv in place. Rows to check are written to Data/Review/<filename>.csv
+
+    # Arguments #
+    :arg filename: Generic name of the input data file
+    :type filename: str
+    :arg apiKey: apiKey for TomTom
+    :type apiKey: str
+    :arg geocodeArgs: passed on to PopulateDataframe, ex. reference or workers
+    :type geocodeArgs: dict
+
+    # Returns #
+    :return: The dataframe with coordinates
+    :rtype: pd.DataFrame
+    """
+    import pandas as pd
+    path = os.path.join(os.getcwd(), 'Data', filename + '.csv')
+    reviewPath = os.path.join(os.getcwd(), 'Data', 'Review', filename + '.csv')
+    df = pd.read_csv(path)
+    df = df.drop(columns=[column for column in df.columns if column.startswith('Unnamed')])
+    df, review = PopulateDataframe(df, apiKey, **geocodeArgs)
+    # Write next to the old file then swap it in, so a crash never leaves half a file
+    df.to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    if len(review):
+        os.makedirs(os.path.dirname(reviewPath), exist_ok=True)
+        review.to_csv(reviewPath, index=False)
+        print(f'{len(review)} rows need a look, see {reviewPath}')
+    elif os.path.exists(reviewPath):
+        os.remove(reviewPath)
+    return df
 
-with open(os.path.join(os.getcwd(),'Keys.json'), 'r') as f:
-    keys = json.load(f)
 
-coords = PopulateDataframe(df, keys['TomTom'])
-print(coords)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Geocode the addresses in Data/<filename>.csv')
+    parser.add_argument('filename', nargs='?', default='AddressesFull')
+    parser.add_argument('--pick-first', action='store_true', help='always take the top result, never flag rows for review')
+    parser.add_argument('--reference', type=float, nargs=2, metavar=('LAT', 'LON'), help='pick the candidate nearest this point')
+    parser.add_argument('--spread', type=float, default=0.25, help='km candidates may be apart before a row is flagged')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate-limit', type=float, default=5)
+    args = parser.parse_args()
+    print(geocodeFile(args.filename, loadKeys().get('TomTom'), pickFirst=args.pick_first, reference=args.reference,
+                      spread=args.spread, workers=args.workers, rateLimit=args.rate_limit))
@@ -0,0 +1,245 @@
+# Import Statements
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scripts.Solver import costMatrix, solveExact, solveHeuristic
+
+# -------------------------------------- Partitioning Stops -------------------------------------- #
+
+# A fleet is a list of routes, one per vehicle. Every vehicle leaves from and returns to the depot, and every other
+# location is visited by exactly one vehicle. Stops are split up by where they are first, then each vehicle's stops are
+# solved as an ordinary tour, which is much cheaper than one model over every location and every vehicle.
+
+def projectCoordinates(coordinates:np.ndarray) -> np.ndarray:
+    """ Flattens (Latitude, Longitude) to kilometers east and north of their middle, plenty accurate at city scale
+
+    # Arguments #
+    :arg coordinates: N x 2 array of (Latitude, Longitude) in degrees
+    :type coordinates: np.ndarray
+
+    # Returns #
+    :return points: N x 2 array of (east, north) in kilometers
+    :rtype points: np.ndarray
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    latitude, longitude = coordinates[:, 0], coordinates[:, 1]
+    return np.column_stack(((longitude - longitude.mean()) * 111.32 * np.cos(np.radians(latitude.mean())),
+                            (latitude - latitude.mean()) * 110.57))
+
+
+def fleetSize(demand:np.ndarray, vehicles:int=None, capacity:float=None) -> int:
+    """ How many vehicles to split the stops over. As many as asked for, or as few as carry all the demand
+
+    # Arguments #
+    :arg demand: How much each stop takes up in a vehicle
+    :type demand: np.ndarray
+    :arg vehicles: Number of vehicles, None to use as few as capacity allows
+    :type vehicles: int
+    :arg capacity: Most demand one vehicle can carry, None for no limit
+    :type capacity: float
+
+    # Returns #
+    :return vehicles: Number of vehicles
+    :rtype vehicles: int
+    """
+    if capacity is not None and demand.max(initial=0) > capacity:
+        raise ValueError(f'A stop needs {demand.max()}, more than the capacity of {capacity}')
+    if vehicles is None:
+        if capacity is None:
+            raise ValueError('Give the number of vehicles, their capacity, or both')
+        return max(1, int(np.ceil(demand.sum() / capacity)))
+    if capacity is not None and demand.sum() > vehicles * capacity:
+        raise ValueError(f'{vehicles} vehicles of capacity {capacity} can\'t carry a total demand of {demand.sum()}')
+    return max(1, min(vehicles, len(demand)))
+
+
+def assignClusters(distances:np.ndarray, demand:np.ndarray, capacity:float=None) -> np.ndarray:
+    """ Gives each stop to its nearest cluster with room left. Stops with the most to lose from not getting their nearest
+        cluster go first, so the stops that end up moved are the ones that barely care
+
+    # Arguments #
+    :arg distances: N x K distances from each stop to each cluster center
+    :type distances: np.ndarray
+    :arg demand: How much each stop takes up in a vehicle
+    :type demand: np.ndarray
+    :arg capacity: Most demand one cluster can take, None for no limit
+    :type capacity: float
+
+    # Returns #
+    :return labels: The cluster of each stop
+    :rtype labels: np.ndarray
+    """
+    if capacity is None:
+        return distances.argmin(axis=1)
+    preference = np.argsort(distances, axis=1)
+    ranked = np.take_along_axis(distances, preference, axis=1)
+    regret = ranked[:, 1] - ranked[:, 0] if distances.shape[1] > 1 else np.zeros(len(distances))
+    load = np.zeros(distances.shape[1])
+    labels = np.empty(len(distances), dtype=int)
+    for stop in np.argsort(-regret, kind='stable'):
+        for cluster in preference[stop]:
+            if load[cluster] + demand[stop] <= capacity:
+                break
+        else:
+            # Greedy packing can strand a big stop even when the total fits, it goes where the most room is left
+            cluster = int(np.argmin(load))
+        labels[stop] = cluster
+        load[cluster] += demand[stop]
+    return labels
+
+
+def kmeansClusters(points:np.ndarray, vehicles:int=None, capacity:float=None, demand:np.ndarray=None, seed:int=0, iterations:int=100) -> np.ndarray:
+    """ Splits stops into compact groups with k-means, seeded with k-means++. With a capacity, every assignment step
+        respects it, so the clusters stay compact and no vehicle is overloaded
+
+    # Arguments #
+    :arg points: N x 2 positions from projectCoordinates
+    :type points: np.ndarray
+    :arg vehicles: Number of clusters, None to use as few as capacity allows
+    :type vehicles: int
+    :arg capacity: Most demand one cluster can take, None for no limit
+    :type capacity: float
+    :arg demand: How much each stop takes up, one each if not given
+    :type demand: np.ndarray
+    :arg seed: Seed for picking the starting centers, so the same data always splits the same way
+    :type seed: int
+    :arg iterations: Most rounds of moving the centers
+    :type iterations: int
+
+    # Returns #
+    :return labels: The cluster of each stop, numbered from 0
+    :rtype labels: np.ndarray
+    """
+    demand = np.ones(len(points)) if demand is None else np.asarray(demand, dtype=float)
+    k = fleetSize(demand, vehicles, capacity)
+    rng = np.random.default_rng(seed)
+    centers = [points[rng.integers(len(points))]]
+    nearest = ((points - centers[0])**2).sum(axis=1)
+    for _ in range(1, k):
+        # k-means++, further points are more likely to start a cluster
+        total = nearest.sum()
+        choice = rng.choice(len(points), p=nearest / total) if total > 0 else rng.integers(len(points))
+        centers.append(points[choice])
+        nearest = np.minimum(nearest, ((points - points[choice])**2).sum(axis=1))
+    centers = np.array(centers)
+    labels = None
+    for _ in range(iterations):
+        distances = np.sqrt(((points[:, None, :] - centers[None, :, :])**2).sum(axis=2))
+        update = assignClusters(distances, demand, capacity)
+        if labels is not None and np.array_equal(update, labels):
+            break
+        labels = update
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, points[:, axis], minlength=k) for axis in range(2)], axis=1)
+        # An empty cluster keeps its old center rather than vanishing
+        centers = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+    return labels
+
+
+def sweepClusters(points:np.ndarray, vehicles:int=None, capacity:float=None, demand:np.ndarray=None, center:np.ndarray=None) -> np.ndarray:
+    """ Splits stops into wedges around the depot, sweeping a ray around it and cutting it into even shares of the
+        demand, or into full vehicles if the even split doesn't fit. The sweep starts at the widest empty gap, so no
+        wedge straddles it
+
+    # Arguments #
+    :arg points: N x 2 positions from projectCoordinates
+    :type points: np.ndarray
+    :arg vehicles: Number of wedges, None to use as few as capacity allows
+    :type vehicles: int
+    :arg capacity: Most demand one wedge can take, None for no limit
+    :type capacity: float
+    :arg demand: How much each stop takes up, one each if not given
+    :type demand: np.ndarray
+    :arg center: Position of the depot, the middle of the stops if not given
+    :type center: np.ndarray
+
+    # Returns #
+    :return labels: The wedge of each stop, numbered from 0 in sweep order
+    :rtype labels: np.ndarray
+    """
+    demand = np.ones(len(points)) if demand is None else np.asarray(demand, dtype=float)
+    k = fleetSize(demand, vehicles, capacity)
+    center = points.mean(axis=0) if center is None else np.asarray(center, dtype=float)
+    angles = np.arctan2(points[:, 1] - center[1], points[:, 0] - center[0])
+    order = np.argsort(angles, kind='stable')
+    gaps = np.diff(np.append(angles[order], angles[order[0]] + 2 * np.pi))
+    order = np.roll(order, -(int(np.argmax(gaps)) + 1))
+    labels = np.empty(len(points), dtype=int)
+    if vehicles is not None:
+        # Cut the sweep where the running demand crosses each even share
+        cumulative = np.cumsum(demand[order]) - demand[order] / 2
+        labels[order] = np.minimum((cumulative / demand.sum() * k).astype(int), k - 1)
+        if capacity is None or np.bincount(labels, demand).max() <= capacity:
+            return labels
+    # Otherwise fill each wedge up to capacity before starting the next, which can take more than vehicles wedges
+    cluster, load = 0, 0.0
+    for stop in order:
+        if load + demand[stop] > capacity:
+            cluster, load = cluster + 1, 0.0
+        labels[stop] = cluster
+        load += demand[stop]
+    return labels
+
+# -------------------------------------- Solving a Fleet -------------------------------------- #
+
+def solveFleet(distMatrix:np.ndarray, coordinates:np.ndarray, vehicles:int=None, cluster:str='kmeans', capacity:float=None,
+               demand:np.ndarray=None, depot:int=0, method:str='heuristic', workers:int=None, seed:int=0) -> list:
+    """ Splits the stops between vehicles, then solves each vehicle's tour through the depot on its own, in parallel.
+        Uses the same distance matrix as the single tour, only the rows and columns of each vehicle's stops are read
+
+    # Arguments #
+    :arg distMatrix: N x N distances from validateCache
+    :type distMatrix: np.ndarray
+    :arg coordinates: N x 2 array of (Latitude, Longitude) of every location, ex. df[['Latitude', 'Longitude']]
+    :type coordinates: np.ndarray
+    :arg vehicles: Number of vehicles, None to use as few as capacity allows
+    :type vehicles: int
+    :arg cluster: 'kmeans' for compact groups, 'sweep' for wedges around the depot
+    :type cluster: str
+    :arg capacity: Most demand one vehicle can carry, None for no limit
+    :type capacity: float
+    :arg demand: How much each location takes up, one each if not given. The depot's is ignored
+    :type demand: np.ndarray
+    :arg depot: Location every vehicle starts and ends at
+    :type depot: int
+    :arg method: 'heuristic' or 'exact', how each vehicle's tour is solved, see Solver
+    :type method: str
+    :arg workers: Number of processes solving tours at the same time, 1 solves them all here
+    :type workers: int
+    :arg seed: Seed for k-means
+    :type seed: int
+
+    # Returns #
+    :return fleet: One routes dictionary per vehicle, each a tour starting from the depot
+    :rtype fleet: list
+    """
+    solvers = {'heuristic': solveHeuristic, 'exact': solveExact}
+    if method not in solvers:
+        raise ValueError(f'Unknown solve method "{method}"')
+    N = len(distMatrix)
+    stops = np.delete(np.arange(N), depot)
+    if len(stops) == 0:
+        return [{depot: depot}]
+    points = projectCoordinates(coordinates)
+    demand = None if demand is None else np.delete(np.asarray(demand, dtype=float), depot)
+    if cluster == 'kmeans':
+        labels = kmeansClusters(points[stops], vehicles, capacity, demand, seed)
+    elif cluster == 'sweep':
+        labels = sweepClusters(points[stops], vehicles, capacity, demand, points[depot])
+    else:
+        raise ValueError(f'Unknown clustering "{cluster}"')
+    # The depot goes first in every group, so each tour starts from it at local index 0
+    groups = [np.concatenate(([depot], stops[labels == c])) for c in np.unique(labels)]
+    costs = costMatrix(distMatrix)
+    subMatrices = [costs[np.ix_(group, group)] for group in groups]
+    if workers == 1 or len(groups) == 1:
+        solutions = [solvers[method](subMatrix) for subMatrix in subMatrices]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            solutions = list(pool.map(solvers[method], subMatrices))
+    return [{int(group[i]): int(group[j]) for i, j in routes.items()} for group, routes in zip(groups, solutions)]
+
+
+def fleetLength(distMatrix:np.ndarray, fleet:list) -> np.ndarray:
+    """ Distance driven by each vehicle of a fleet from solveFleet """
+    distMatrix = np.asarray(distMatrix)
+    return np.array([float(distMatrix[list(routes.keys()), list(routes.values())].sum()) for routes in fleet])
@@ -1,14 +1,40 @@
 # Import Statements
+import gzip
+import io
 import json
-import requests
-import pandas as pd
 import numpy as np
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from urllib.parse import urlencode
+from scipy import sparse
+from scripts.Arcs import arcNames, subtourNames
+from scripts.CoordinateMapper import greatCircle
+from scripts.Cache import CACHE_PATH, PairCache, normalizeAddress, pairKey, sourceHash, saveDistanceMatrix, readMatrixMeta, loadDistanceMatrix, estimateName
+from scripts.Network import RateLimiter, makeSession, getJSON
+from scripts.Profiler import stage
+from scripts.Solver import costMatrix, routesToOrder, solveHeuristic
 
 # -------------------------------------- Creating the Distance Matrix -------------------------------------- #
 
+DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+# Modes of travel as Google spells them, keyed on every name the rest of the project uses for them, ex. TomTom's
+GOOGLE_MODES = {'bicycling': 'bicycling', 'bicycle': 'bicycling', 'walking': 'walking', 'pedestrian': 'walking',
+                'driving': 'driving', 'car': 'driving', 'transit': 'transit'}
+
+def apiAddress(address:str) -> str:
+    """ An address as it should reach Google. Older code swapped spaces for +, which urlencode would send as a literal %2B """
+    return ' '.join(str(address).replace('+', ' ').split())
+
+def googleMode(mode:str) -> str:
+    """ Google's name for a mode of travel, so a mode that isn't one of theirs fails here instead of quietly routing by car """
+    if mode.lower() not in GOOGLE_MODES:
+        raise ValueError(f'Unknown mode of travel "{mode}", pick one of {list(GOOGLE_MODES)}')
+    return GOOGLE_MODES[mode.lower()]
+
 # Define API Call Function
-def RouteCaller(loc1:str, loc2:str,  key:str=None, units:str='meters', routeType:str='BICYCLE') -> float:
+def RouteCaller(loc1:str, loc2:str,  key:str=None, units:str='metric', routeType:str='bicycling', session:'requests.Session'=None, limiter:RateLimiter=None, retries:int=3, url:str=DIRECTIONS_URL) -> float:
     """ Function that makes a single API call between two distances
 
     # Arguments #
@@ -16,99 +42,535 @@ def RouteCaller(loc1:str, loc2:str,  key:str=None, units:str='meters', routeType
     :type loc1: str
     :arg loc2: Ending location for the route
     :type loc2: str
-    :arg units: Measuring system for the route, metric of imperial
+    :arg units: Measuring system for the route text, metric or imperial. The distance returned is always kilometers
     :type units: str
-    :arg routeType: Mode of travel for the route. Default is Bicyle because that's the purpose of this project
+    :arg routeType: Mode of travel for the route, see GOOGLE_MODES. Default is Bicyle because that's the purpose of this project
     :type routeType: str
+    :arg session: Pooled session to reuse connections with, a new one is made if not given
+    :type session: requests.Session
+    :arg limiter: Rate limiter shared with any other threads calling the API
+    :type limiter: RateLimiter
+    :arg retries: How many times to retry a failed request, with backoff
+    :type retries: int
+    :arg url: Directions endpoint, only changed to point at a test server
+    :type url: str
     """
-    print(f'Getting data for {loc1} to {loc2}')
     # Verify Key exists
     if key == None:
         raise ValueError('No API Key has been passed. Please insert key and try again')
-    # Ping the API
-    retVal = requests.get(
-        f"https://maps.googleapis.com/maps/api/directions/json?destination={loc1}&origin={loc2}&units={units}&mode={routeType}&key={key}").json()
+    if session is None:
+        session = makeSession(1)
+    # Ping the API, addresses are encoded so a # or & in one can't cut the query short
+    query = urlencode({'destination': apiAddress(loc1), 'origin': apiAddress(loc2), 'units': units, 'mode': googleMode(routeType), 'key': key})
+    retVal = getJSON(session, f"{url}?{query}", limiter, retries)
     if 'error_message' in retVal.keys():
         # Error handling
         print(
             f"Error when pinging API, issue: {retVal['error_message']}")
-        return np.NaN
+        return np.nan
     else:
-        # Return the route information
-        return float(retVal['routes'][0]['legs'][0]['distance']['text'][:-3])
+        # Return the route information. The text is rounded and in whatever units Google picked, the value is always meters
+        return retVal['routes'][0]['legs'][0]['distance']['value'] / 1000
+
+# Distance providers all take the origin and destination rows of the DataFrame, and return a block of shape
+# (len(origins), len(destinations)) where cell [i, j] is the distance in kilometers from origin i to destination j
+def pairProvider(origins:'pd.DataFrame', destinations:'pd.DataFrame', key:str, session:'requests.Session'=None, limiter:RateLimiter=None, retries:int=3, url:str=DIRECTIONS_URL, mode:str='bicycling') -> np.ndarray:
+    """ Distance provider that asks the Directions API for one route per ordered pair, using RouteCaller
+
+    # Arguments #
+    :arg origins: rows of the DataFrame the routes start from, needs an Address column
+    :type origins: pd.DataFrame
+    :arg destinations: rows of the DataFrame the routes end at, needs an Address column
+    :type destinations: pd.DataFrame
+    :arg key: API key, so that Google knows who is calling
+    :type key: str
+    :arg session: Pooled session to reuse connections with
+    :type session: requests.Session
+    :arg limiter: Rate limiter shared with any other threads calling the API
+    :type limiter: RateLimiter
+    :arg retries: How many times to retry a failed request, with backoff
+    :type retries: int
+    :arg url: Directions endpoint, only changed to point at a test server
+    :type url: str
+    :arg mode: Mode of travel for the routes, see GOOGLE_MODES
+    :type mode: str
+
+    # Returns #
+    :return block: distances from every origin to every destination
+    :rtype block: np.ndarray
+    """
+    block = np.zeros((len(origins), len(destinations)))
+    for i, origin in enumerate(origins['Address']):
+        for j, destination in enumerate(destinations['Address']):
+            # If location equals itself then give 0 for distance, no need to ping the API
+            if origin != destination:
+                # RouteCaller takes the destination first
+                block[i, j] = RouteCaller(destination, origin, key, routeType=mode, session=session, limiter=limiter, retries=retries, url=url)
+    return block
+
+def matrixProvider(origins:'pd.DataFrame', destinations:'pd.DataFrame', key:str, session:'requests.Session'=None, limiter:RateLimiter=None, retries:int=3, url:str=DISTANCE_MATRIX_URL, mode:str='bicycling') -> np.ndarray:
+    """ Distance provider that asks the Distance Matrix API for a whole block of origins x destinations in one request.
+        Google allows at most 100 elements per request, so keep blocks to 10 x 10.
+
+    # Arguments #
+    :arg origins: rows of the DataFrame the routes start from, needs an Address column
+    :type origins: pd.DataFrame
+    :arg destinations: rows of the DataFrame the routes end at, needs an Address column
+    :type destinations: pd.DataFrame
+    :arg key: API key, so that Google knows who is calling
+    :type key: str
+    :arg session: Pooled session to reuse connections with
+    :type session: requests.Session
+    :arg limiter: Rate limiter shared with any other threads calling the API
+    :type limiter: RateLimiter
+    :arg retries: How many times to retry a failed request, with backoff
+    :type retries: int
+    :arg url: Distance Matrix endpoint, only changed to point at a test server
+    :type url: str
+    :arg mode: Mode of travel for the routes, see GOOGLE_MODES
+    :type mode: str
+
+    # Returns #
+    :return block: distances from every origin to every destination, NaN where Google had no route
+    :rtype block: np.ndarray
+    """
+    if key == None:
+        raise ValueError('No API Key has been passed. Please insert key and try again')
+    if session is None:
+        session = makeSession(1)
+    query = urlencode({'origins': '|'.join(map(apiAddress, origins['Address'])), 'destinations': '|'.join(map(apiAddress, destinations['Address'])), 'mode': googleMode(mode), 'key': key})
+    retVal = getJSON(session, f"{url}?{query}", limiter, retries)
+    block = np.full((len(origins), len(destinations)), np.nan)
+    if retVal.get('status') != 'OK':
+        print(f"Error when pinging API, issue: {retVal.get('error_message', retVal.get('status'))}")
+        return block
+    for i, row in enumerate(retVal['rows']):
+        for j, element in enumerate(row['elements']):
+            if element['status'] == 'OK':
+                # Numeric value is in meters, keep the matrix in kilometers
+                block[i, j] = element['distance']['value'] / 1000
+    return block
+
+# Road distance over straight line distance, typical for a city street grid
+DETOUR_FACTORS = {'bicycling': 1.3, 'walking': 1.25, 'driving': 1.35}
+
+def greatCircleMatrix(origins:'pd.DataFrame', destinations:'pd.DataFrame'=None, detour:float=1.0) -> np.ndarray:
+    """ Estimates distances from coordinates alone, no API needed. Every pair is done at once with NumPy broadcasting,
+        2,000 locations take a fraction of a second.
+
+    # Arguments #
+    :arg origins: rows of the DataFrame the routes start from, needs Latitude and Longitude columns
+    :type origins: pd.DataFrame
+    :arg destinations: rows the routes end at, defaults to origins
+    :type destinations: pd.DataFrame
+    :arg detour: multiplier from straight line to road distance, see DETOUR_FACTORS
+    :type detour: float
+
+    # Returns #
+    :return block: estimated distances in kilometers from every origin to every destination
+    :rtype block: np.ndarray
+    """
+    if destinations is None:
+        destinations = origins
+    for frame in (origins, destinations):
+        if not {'Latitude', 'Longitude'} <= set(frame.columns):
+            raise ValueError('Great circle distances need Latitude and Longitude columns, run scripts.CoordinateMapper first')
+    lat1, lon1 = origins['Latitude'].to_numpy(float), origins['Longitude'].to_numpy(float)
+    lat2, lon2 = destinations['Latitude'].to_numpy(float), destinations['Longitude'].to_numpy(float)
+    return detour * greatCircle(lat1[:, None], lon1[:, None], lat2[None, :], lon2[None, :])
+
+def greatCircleProvider(origins:'pd.DataFrame', destinations:'pd.DataFrame', key:str=None, session:'requests.Session'=None, limiter:RateLimiter=None, retries:int=3, detour:float=1.0, mode:str=None) -> np.ndarray:
+    """ Distance provider that estimates a block from coordinates with greatCircleMatrix. Takes the same arguments as the
+        other providers so it can stand in for them, but never touches the network. The mode is
+        ignored, pick the detour for it instead
+    """
+    return greatCircleMatrix(origins, destinations, detour)
+
+def nearestArcs(distMatrix:np.ndarray, neighbours:int) -> np.ndarray:
+    """ Routes (arcs) from each location to its closest destinations, and into it from its closest origins
+
+    # Arguments #
+    :arg distMatrix: a distance matrix of size N x N
+    :type distMatrix: np.ndarray
+    :arg neighbours: how many of the closest locations to keep routes to and from
+    :type neighbours: int
+
+    # Returns #
+    :return arcs: N x N boolean array, True where route i -> j is kept, never on the diagonal
+    :rtype arcs: np.ndarray
+    """
+    NumElements = len(distMatrix)
+    arcs = ~np.eye(NumElements, dtype=bool)
+    if neighbours >= NumElements - 1:
+        return arcs
+    costs = costMatrix(distMatrix)
+    np.fill_diagonal(costs, np.inf)
+    # Closest destinations from each location, and closest origins to each location
+    out = np.argpartition(costs, neighbours - 1, axis=1)[:, :neighbours]
+    into = np.argpartition(costs, neighbours - 1, axis=0)[:neighbours, :]
+    kept = np.zeros_like(arcs)
+    kept[np.arange(NumElements)[:, None], out] = True
+    kept[into, np.arange(NumElements)[None, :]] = True
+    return kept & arcs
+
+# Registered providers, with the block size each one should be asked for
+PROVIDERS = {
+    'directions': (pairProvider, 1),
+    'matrix': (matrixProvider, 10),
+    'greatcircle': (greatCircleProvider, 4096),
+}
 
 # Define the Distance Matrix
-def generateDistanceMatrix(df:pd.DataFrame, key:str) -> np.ndarray:
-    """ Takes in a DataFrame, and returns a numpy array
+def generateDistanceMatrix(df:'pd.DataFrame', key:str, provider='directions', tile:int=None, workers:int=8, rateLimit:float=50, retries:int=3, mask:np.ndarray=None, store=None, mode:str='bicycling') -> np.ndarray:
+    """ Takes in a DataFrame, and returns a numpy array. The matrix is split into tiles of origins x destinations,
+        and each tile is handed to the distance provider on a thread pool sharing one pooled session. A tile that fails
+        even after its retries is left NaN rather than throwing away every other tile
 
     # Arguments #
     :arg df: all of the addresses in the problem, placed in a pandas DataFrame
     :type df: pd.DataFrame
     :arg key: API key, so that Google knows who is calling
     :type key: str
+    :arg provider: name of a provider in PROVIDERS, or any function with the same arguments as pairProvider
+    :type provider: str or callable
+    :arg tile: size of the blocks handed to the provider, defaults to the registered size or 1
+    :type tile: int
+    :arg workers: Number of threads making calls at the same time
+    :type workers: int
+    :arg rateLimit: Maximum API calls per second, across all threads
+    :type rateLimit: float
+    :arg retries: How many times to retry a failed call, with backoff
+    :type retries: int
+    :arg mask: N x N boolean array of the cells to fetch, defaults to everything off the diagonal
+    :type mask: np.ndarray
+    :arg store: called with (rows, cols, block) as each tile arrives, ex. to cache it before the rest are done
+    :type store: callable
+    :arg mode: Mode of travel, handed to the provider
+    :type mode: str
 
     # Returns #
-    :return distMatrix: A matrix of size NxN, where N is the number of locations in DataFrame df
+    :return distMatrix: A matrix of size NxN, where N is the number of locations in DataFrame df. Cell [i, j] is the distance from i to j.
+        Cells that weren't fetched, or whose tile failed, are NaN
     :rtype distMatrix: np.ndarray
     """
-    # Local array storage
-    distDict = {}
-    arrays = []
-    i = 0
-    # Iterate through the DataFrame
-    for index1, row1 in df.iterrows():
-        distDict[index1] = []
-        for index2, row2 in df.iterrows():
-            if index1 == index2:
-                # If location equals itself then give 0 for distance, no need to ping the API
-                distDict[index1].append(0)
-
-            elif index1 != index2:
-                i += 1
-                # Ping Google's Destination API for route data
-                distDict[index1].append(RouteCaller(df.iloc[index1]['Address'], df.iloc[index2]['Address'], key))
-    print(f'Successfully made {i} calls to the Google Maps Route API')
-    # Process data into arrays, stack, and return
-    for key in distDict.keys():
-        arrays.append(np.array(distDict[key]))
-    distMatrix = np.vstack(arrays)
+    if isinstance(provider, str):
+        provider, defaultTile = PROVIDERS[provider]
+        tile = tile or defaultTile
+    tile = tile or 1
+    df = df.reset_index(drop=True)
+    NumElements = len(df)
+    if mask is None:
+        # A location is always 0 away from itself, no need to ping the API
+        mask = ~np.eye(NumElements, dtype=bool)
+    if provider in (pairProvider, matrixProvider) and mask.any():
+        # A missing key or a mode Google doesn't know fails once here, rather than once per tile
+        if key is None:
+            raise ValueError('No API Key has been passed. Please insert key and try again')
+        googleMode(mode)
+    distMatrix = np.full((NumElements, NumElements), np.nan)
+    distMatrix[np.eye(NumElements, dtype=bool)] = 0
+    # Only ask for the rows and columns of each tile that have something missing, so adding k stops costs about 2kN cells.
+    # Tiles are made as they are submitted, only counted up front
+    blocks = -(-NumElements // tile)
+    padded = np.zeros((blocks * tile, blocks * tile), dtype=bool)
+    padded[:NumElements, :NumElements] = mask
+    occupied = padded.reshape(blocks, tile, blocks, tile).any(axis=(1, 3))
+    total = int(occupied.sum())
+    tiles = ((r, c, r * tile + np.flatnonzero(mask[r * tile:(r + 1) * tile, c * tile:(c + 1) * tile].any(axis=1)),
+              c * tile + np.flatnonzero(mask[r * tile:(r + 1) * tile, c * tile:(c + 1) * tile].any(axis=0)))
+             for r, c in zip(*np.nonzero(occupied)))
+    # Slicing a DataFrame costs far more than a call to a local provider, so every whole block is sliced just once
+    frames = [df.iloc[b * tile:(b + 1) * tile] for b in range(blocks)]
+    session = makeSession(workers)
+    limiter = RateLimiter(rateLimit)
+
+    def fetchTile(r, c, rows, cols):
+        # Partial blocks are sliced in the worker, so only the tiles in flight ever have their own DataFrames
+        origins = frames[r] if len(rows) == len(frames[r]) else df.iloc[rows]
+        destinations = frames[c] if len(cols) == len(frames[c]) else df.iloc[cols]
+        return provider(origins, destinations, key, session=session, limiter=limiter, retries=retries, mode=mode)
+
+    done, failed, firstError = 0, 0, None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # A few tiles queued per worker keeps them busy without holding a future for every tile at once
+        pending = {}
+        while True:
+            for r, c, rows, cols in islice(tiles, 4 * workers - len(pending)):
+                pending[pool.submit(fetchTile, r, c, rows, cols)] = (rows, cols)
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                rows, cols = pending.pop(future)
+                done += 1
+                try:
+                    block = future.result()
+                except Exception as e:
+                    # Its cells stay NaN, so they are fetched again next time while every other tile is kept
+                    failed += 1
+                    firstError = firstError or e
+                    print(f'Tile of {len(rows)} x {len(cols)} failed, issue: {e}')
+                    continue
+                distMatrix[np.ix_(rows, cols)] = block
+                if store is not None:
+                    store(rows, cols, block)
+                if done % max(1, total // 20) == 0 or done == total:
+                    print(f'Fetched {done} of {total} tiles')
+    session.close()
+    if total and failed == total:
+        # Nothing worked at all, which is better raised than reported as a matrix of gaps
+        raise firstError
+    np.fill_diagonal(distMatrix, 0)
+    print(f'Successfully fetched {int((mask & ~np.isnan(distMatrix)).sum())} of {int(mask.sum())} distances in {total - failed} of {total} tiles')
     return distMatrix
 
 
-def validateCache(filename:str,df:pd.DataFrame,key:str=None) -> np.ndarray:
-    """ Validate and load cached data, to prevent unnecessary API calls
+# -------------------------------------- Checking the Distance Matrix -------------------------------------- #
+
+# Modes where the route back is the same length as the route there. One way streets make bike and car routes differ
+SYMMETRIC_MODES = {'walking'}
+
+def validateMatrix(distMatrix:np.ndarray, addresses:list=None, neighbours:int=10, slack:float=1.5, margin:float=0.1) -> dict:
+    """ Looks for cells of a distance matrix that can't be right. Missing, infinite, or negative distances, zeros between
+        two different places, and routes that are far longer than going through one of the nearby locations instead.
+        The detour check only tries each origin's closest locations as the stop in between, so it is N**2 x neighbours.
+
+    # Arguments #
+    :arg distMatrix: N x N distances in kilometers
+    :type distMatrix: np.ndarray
+    :arg addresses: Address of every location, so a zero between two rows of the same address isn't flagged
+    :type addresses: list
+    :arg neighbours: how many of each origin's closest locations to try going through
+    :type neighbours: int
+    :arg slack: how many times longer than the detour a route may be before it is flagged
+    :type slack: float
+    :arg margin: kilometers a route may be over slack times the detour anyway, since distances come rounded
+    :type margin: float
+
+    # Returns #
+    :return problems: N x N boolean arrays of the 'invalid', 'zero', and 'triangle' cells
+    :rtype problems: dict
+    """
+    distMatrix = np.asarray(distMatrix, dtype=float)
+    NumElements = len(distMatrix)
+    offDiagonal = ~np.eye(NumElements, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        invalid = (~np.isfinite(distMatrix) | (distMatrix < 0)) & offDiagonal
+    zero = (distMatrix == 0) & offDiagonal
+    if addresses is not None:
+        normalized = np.array([normalizeAddress(address) for address in addresses])
+        zero &= normalized[:, None] != normalized[None, :]
+    triangle = np.zeros_like(invalid)
+    k = min(neighbours, NumElements - 2)
+    if k > 0:
+        # Bad cells would make every route through them look like a shortcut, so they can't be part of a detour
+        costs = np.where(invalid | zero, np.inf, distMatrix)
+        closeness = np.minimum(costs, costs.T)
+        np.fill_diagonal(closeness, np.inf)
+        through = np.argpartition(closeness, k - 1, axis=1)[:, :k]
+        # A few hundred origins at a time keeps the N x k x N detours to a few tens of MB
+        for start in range(0, NumElements, 256):
+            rows = np.arange(start, min(start + 256, NumElements))
+            detour = (costs[rows[:, None], through[rows]][:, :, None] + costs[through[rows]]).min(axis=1)
+            triangle[rows] = costs[rows] > slack * detour + margin
+        triangle &= offDiagonal & ~invalid & ~zero
+    return {'invalid': invalid, 'zero': zero, 'triangle': triangle}
+
+def describeProblems(problems:dict, addresses:list=None, limit:int=5) -> str:
+    """ One line per kind of problem validateMatrix found, with the first few cells of each. Empty if there are none """
+    lines = []
+    for name, cells in problems.items():
+        rows, cols = np.nonzero(cells)
+        if len(rows):
+            shown = [f'{addresses[i]} -> {addresses[j]}' if addresses is not None else f'{i} -> {j}' for i, j in zip(rows[:limit].tolist(), cols[:limit].tolist())]
+            lines.append(f'{len(rows)} {name} cells: {", ".join(shown)}{", ..." if len(rows) > limit else ""}')
+    return '\n'.join(lines)
+
+def fillMissing(distMatrix:np.ndarray, df:'pd.DataFrame'=None, detour:float=1.0) -> int:
+    """ Fills missing distances in place, from the route the other way if there is one, otherwise from the great circle
+        estimate when the DataFrame has Latitude and Longitude
+
+    # Arguments #
+    :arg distMatrix: N x N distances, NaN where missing
+    :type distMatrix: np.ndarray
+    :arg df: the locations, for the great circle estimate
+    :type df: pd.DataFrame
+    :arg detour: multiplier from great circle to road distance
+    :type detour: float
+
+    # Returns #
+    :return filled: how many cells were filled
+    :rtype filled: int
+    """
+    missing = ~np.isfinite(distMatrix)
+    reverse = missing & np.isfinite(distMatrix.T)
+    distMatrix[reverse] = distMatrix.T[reverse]
+    gaps = missing & ~reverse
+    if gaps.any() and df is not None and {'Latitude', 'Longitude'} <= set(df.columns):
+        distMatrix[gaps] = greatCircleMatrix(df, detour=detour)[gaps]
+    return int((missing & np.isfinite(distMatrix)).sum())
+
+# Old snapshots were read from Google's distance text, rounded to the nearest 100 m, or kilometer past 100 km
+LEGACY_TOLERANCE = {'atol': 0.05 + 1e-9, 'rtol': 0.005}
+
+def validateCache(filename:str,df:'pd.DataFrame',key:str=None,provider='directions',mode:str='bicycling',cachePath:str=CACHE_PATH,dtype:str='float64',mmap_mode:str='r',prefilter:int=None,detour:float=None,symmetric:bool=None,fill:bool=False,strict:bool=False,**fetchArgs) -> np.ndarray:
+    """ Validate and load cached data, to prevent unnecessary API calls. Every route is cached on its own, keyed on a hash of
+        (origin, destination, mode), so only pairs that have never been seen before are fetched, whatever file they came from.
+        The assembled matrix is saved as a snapshot in CachedDistances/<filename>.npy, with a .json header, and reopened
+        memory mapped whenever the addresses haven't changed.
 
     # Arguments #
     :arg filename: ending of filename to check if it exits. If it doesn't we will end up making it
     :type filename: str
-    :arg df: If no cache, need data to pass to route generator
+    :arg df: Addresses in the problem, used to look up each pair and to fetch the missing ones
     :type df: pd.DataFrame
-    :arg key: If no cache, need key for API call
+    :arg key: If anything is missing from the cache, need key for API call
     :type key: str
+    :arg provider: distance provider for the missing pairs, see generateDistanceMatrix. 'greatcircle' skips the pairwise
+        cache and estimates the whole matrix from Latitude and Longitude, snapshotted as CachedDistances/<filename>-greatcircle.npy
+    :type provider: str or callable
+    :arg mode: Mode of travel, part of every cache key and handed to the provider. Aliases such as 'car' are taken
+        as Google's name for the mode, see GOOGLE_MODES
+    :type mode: str
+    :arg cachePath: Where the pairwise cache lives
+    :type cachePath: str
+    :arg dtype: storage format of the snapshot, float64, float32, or uint32 meters
+    :type dtype: str
+    :arg mmap_mode: how to open an up to date snapshot, None reads it all into memory
+    :type mmap_mode: str
+    :arg prefilter: only fetch routes between each location and this many of its closest, by great circle distance.
+        Every other missing route is filled with the great circle estimate
+    :type prefilter: int
+    :arg detour: multiplier from great circle to road distance, defaults to DETOUR_FACTORS for the mode
+    :type detour: float
+    :arg symmetric: only fetch each pair one way and use it for both, halving the API calls. Defaults to True for
+        SYMMETRIC_MODES. Only routes actually fetched are cached, never the mirrored ones
+    :type symmetric: bool
+    :arg fill: fill distances still missing after fetching, see fillMissing, instead of refusing to go on. A snapshot
+        with filled cells is never reused, so the gaps are fetched again next time
+    :type fill: bool
+    :arg strict: refuse to go on if validateMatrix finds zeros or detour outliers too, not just missing distances
+    :type strict: bool
+    :arg fetchArgs: passed on to generateDistanceMatrix, ex. workers or rateLimit
+    :type fetchArgs: dict
 
     # Returns #
-    :return distMatrix: Returns a distmatrix
+    :return distMatrix: Returns a distmatrix, in the units of the snapshot header
     :rtype distMatrix: np.ndarray
     """
+    # One name per mode, so 'car' and 'driving' share cache keys, snapshots, detour factors and symmetry
+    mode = googleMode(mode)
     path = os.getcwd()
-    # Define where the cache should be
-    cache_filename = os.path.splitext(filename)[0] + ".npy"
     # Check for if the parent folder exists, if not make one
-    if not os.path.exists(os.path.join(os.getcwd(),"CachedDistances")):
-        os.mkdir(os.path.join(path,"CachedDistances"))
-    # Check if the distance matrix doesn't exist, if so make one
-    if not os.path.exists(os.path.join(path,"CachedDistances",cache_filename)):
-        distMatrix = generateDistanceMatrix(df, key)
-        np.save(os.path.join(path,"CachedDistances",cache_filename),distMatrix)
-        return distMatrix
-    # Since the matrix exists, just load it
+    os.makedirs(os.path.join(path,"CachedDistances"), exist_ok=True)
+    addresses = df['Address'].tolist()
+    estimated = provider == 'greatcircle' or bool(prefilter)
+    if detour is None:
+        detour = DETOUR_FACTORS.get(mode, 1.0)
+    if symmetric is None:
+        symmetric = mode in SYMMETRIC_MODES
+    # Estimated and mirrored snapshots are tagged so they are never mistaken for road distances fetched both ways,
+    # and estimated ones go stale when coordinates move
+    snapshotMode = mode
+    if provider == 'greatcircle':
+        snapshotMode = f'{mode}+greatcircle{detour:g}'
     else:
-        distMatrix = np.load(os.path.join(path, "CachedDistances", cache_filename))
-        return distMatrix
+        if symmetric:
+            snapshotMode = f'{snapshotMode}+symmetric'
+        if prefilter:
+            snapshotMode = f'{snapshotMode}+nearest{prefilter}+greatcircle{detour:g}'
+    if estimated:
+        source = sourceHash([f'{a}@{lat:.6f},{lon:.6f}' for a, lat, lon in zip(addresses, df['Latitude'], df['Longitude'])], snapshotMode)
+    else:
+        source = sourceHash(addresses, snapshotMode)
+    # Pure estimates get a snapshot of their own, so prototyping never writes over road distances that were paid for
+    snapshot = estimateName(filename) if provider == 'greatcircle' else filename
+    meta = readMatrixMeta(snapshot)
+    # Same addresses, same order, same mode, same format, so the snapshot is still good
+    if meta is not None and meta['source'] == source and meta['dtype'] == dtype:
+        return loadDistanceMatrix(snapshot, mmap_mode)
+    if provider == 'greatcircle':
+        with stage('estimate'):
+            distMatrix = greatCircleMatrix(df, detour=detour)
+        with stage('snapshot'):
+            saveDistanceMatrix(snapshot, distMatrix, snapshotMode, source, dtype)
+        return loadDistanceMatrix(snapshot, mmap_mode)
+    NumElements = len(addresses)
+    offDiagonal = ~np.eye(NumElements, dtype=bool)
+    rows, cols = np.nonzero(offDiagonal)
+    keys = [pairKey(addresses[i], addresses[j], mode) for i, j in zip(rows, cols)]
+    with PairCache(cachePath) as cache:
+        distMatrix = np.zeros((NumElements, NumElements))
+        with stage('lookup'):
+            distMatrix[offDiagonal] = cache.lookup(keys)
+        missing = np.isnan(distMatrix)
+        # Carry over a snapshot from before the pairwise cache existed. It doesn't record which addresses it was built
+        # from, so wherever its pairs are already cached, ex. an address shared with another file, they have to agree.
+        # If they don't, the file has likely changed under the same name since, and its old cells would be cached under
+        # the wrong addresses for good
+        if missing[offDiagonal].any() and meta is not None and meta['layout'] == 'legacy' and meta['N'] == NumElements:
+            # Old snapshots hold the route from j to i in cell [i, j]
+            legacy = np.asarray(loadDistanceMatrix(filename), dtype=float).T
+            overlap = ~missing & offDiagonal & ~np.isnan(legacy)
+            if np.allclose(legacy[overlap], distMatrix[overlap], **LEGACY_TOLERANCE):
+                print(f'Importing {filename}.npy into the pairwise cache')
+                distMatrix[missing] = legacy[missing]
+                newKeys = missing[offDiagonal]
+                cache.store([k for k, new in zip(keys, newKeys) if new], distMatrix[offDiagonal][newKeys])
+                missing = np.isnan(distMatrix)
+            else:
+                print(f'Not importing {filename}.npy, it disagrees with the pairwise cache on routes both have')
+        if symmetric:
+            # Wherever one direction is cached, it stands in for the other
+            reverse = missing & ~np.isnan(distMatrix.T)
+            distMatrix[reverse] = distMatrix.T[reverse]
+            missing = np.isnan(distMatrix)
+        if prefilter:
+            estimate = greatCircleMatrix(df, detour=detour)
+            arcs = nearestArcs(estimate, prefilter)
+            missing &= (arcs | arcs.T) if symmetric else arcs
+        if symmetric:
+            # Pairs missing both ways are only fetched from the lower numbered location
+            missing = np.triu(missing, 1)
+        if missing.any():
+            def storeTile(rows, cols, block):
+                # Cached as each tile arrives, so a failure part way through only costs the tiles that failed
+                offTile = rows[:, None] != cols[None, :]
+                origins, destinations = np.nonzero(offTile)
+                cache.store([pairKey(addresses[rows[a]], addresses[cols[b]], mode) for a, b in zip(origins.tolist(), destinations.tolist())],
+                            np.asarray(block)[offTile])
+            with stage('fetch'):
+                fetched = generateDistanceMatrix(df, key, provider, mask=missing, store=storeTile, mode=mode, **fetchArgs)
+            distMatrix[missing] = fetched[missing]
+        if symmetric:
+            back = np.isnan(distMatrix) & ~np.isnan(distMatrix.T)
+            distMatrix[back] = distMatrix.T[back]
+        print(f'Distance cache: {cache.hits} hits, {cache.misses} misses')
+    if prefilter:
+        gaps = np.isnan(distMatrix)
+        distMatrix[gaps] = estimate[gaps]
+        print(f'Estimated {int(gaps.sum())} of {NumElements * (NumElements - 1)} distances from great circles')
+    if fill and np.isnan(distMatrix).any():
+        print(f'Filled {fillMissing(distMatrix, df, detour)} missing distances, they will be fetched again next time')
+        # A hash no data file can have, so this snapshot is never mistaken for a complete one
+        source = sourceHash(addresses, snapshotMode + '+filled')
+    with stage('validate'):
+        problems = validateMatrix(distMatrix, addresses)
+    report = describeProblems(problems, addresses)
+    if report:
+        print(f'Distance matrix check:\n{report}')
+    # Nothing is snapshotted unless it can be solved, the good routes are already cached so only the bad ones are fetched again
+    if problems['invalid'].any():
+        raise ValueError(f'{int(problems["invalid"].sum())} distances for {filename} are missing or invalid, run again to refetch them or pass fill=True:\n{report}')
+    if strict and report:
+        raise ValueError(f'Distance matrix for {filename} failed its check:\n{report}')
+    with stage('snapshot'):
+        saveDistanceMatrix(filename, distMatrix, snapshotMode, source, dtype)
+    return loadDistanceMatrix(filename, mmap_mode)
 
 # -------------------------------------- Defining the Constraints -------------------------------------- #
 
-def generateContraintMatrix(distMatrix:np.ndarray) -> np.ndarray:
+def generateContraintMatrix(distMatrix:np.ndarray) -> sparse.csr_matrix:
     """ Generate the constraint matrix from given distance matrix
 
     # Arguments #
@@ -116,152 +578,269 @@ def generateContraintMatrix(distMatrix:np.ndarray) -> np.ndarray:
     :type distMatrix: np.ndarray
 
     # Returns #
-    :return retVal: Combined constraint matrix, with top and bottom halves stacked nicely
-    :rtype retVal: np.ndarray
+    :return retVal: Combined constraint matrix, with top and bottom halves stacked nicely, stored sparse (2N x N**2, 2N**2 nonzeros)
+    :rtype retVal: sparse.csr_matrix
     """
     NumElements = len(distMatrix)
     """
-        Generates the top portion of the constraint matrix, a 1 x N matrix of ones for index i in N. Here is an example with N = 3.
-        [ 0 0 0 0 0 0 0 0 0 ]        [ 1 1 1 0 0 0 0 0 0 ]
-        | 0 0 0 0 0 0 0 0 0 | --->   | 0 0 0 1 1 1 0 0 0 |
-        [ 0 0 0 0 0 0 0 0 0 ]        [ 0 0 0 0 0 0 1 1 1 ]
-    """
-    retArrayTop = np.zeros(shape=(NumElements,NumElements**2))
-    for index in range(NumElements):
-        retArrayTop[index,index*NumElements:(index+1)*NumElements] = np.ones(shape=(1,NumElements))
+        Column k of the matrix is the variable i{k // N}j{k % N}. Both halves are built in one pass from index arrays.
+        Top half, row i has ones in columns i*N ... (i+1)*N - 1. Here is an example with N = 3.
+        [ 1 1 1 0 0 0 0 0 0 ]
+        | 0 0 0 1 1 1 0 0 0 |
+        [ 0 0 0 0 0 0 1 1 1 ]
+        Bottom half, N x N identity matricies aligned horizontally, so row N + j has ones in columns j, N + j, 2N + j ...
+        [ 1 0 0 1 0 0 1 0 0 ]
+        | 0 1 0 0 1 0 0 1 0 |
+        [ 0 0 1 0 0 1 0 0 1 ]
     """
-        Generates the bottom portion of the constraint matrix, a N x N**2 matrix full of horizontally aligned identity N x N matricies.
-        Example with N = 3.
-        [ 1 0 0 ]   [ 1 0 0 ]   [ 1 0 0 ]         [ 1 0 0 1 0 0 1 0 0 ]
-        | 0 1 0 | + | 0 1 0 | + | 0 1 0 |   --->  | 0 1 0 0 1 0 0 1 0 |
-        [ 0 0 1 ]   [ 0 0 1 ]   [ 0 0 1 ]         [ 0 0 1 0 0 1 0 0 1 ]
-    """
-    individualBottoms = tuple(np.identity(NumElements) for i in range(NumElements))
-    retArrayBottom = np.hstack(individualBottoms)
-    retVal = np.vstack((retArrayTop,retArrayBottom))
-    #retVal = np.vstack((retVal,np.ones(shape=(1,NumElements**2),dtype=np.uint8)))
+    columns = np.arange(NumElements**2)
+    rows = np.concatenate((columns // NumElements, NumElements + columns % NumElements))
+    data = np.ones(2 * NumElements**2)
+    retVal = sparse.coo_matrix((data, (rows, np.tile(columns, 2))), shape=(2 * NumElements, NumElements**2)).tocsr()
+    retVal.sort_indices()
     return retVal
 
 # -------------------------------------- Getting Ready to Solve -------------------------------------- #
 
-def lpGenerator(distMatrix:np.ndarray, constraintMatrix:np.ndarray,filename:str) -> None:
+def pruneArcs(distMatrix:np.ndarray, neighbours:int=None, tour:dict=None) -> np.ndarray:
+    """ Picks which routes (arcs) the LP is allowed to use. Pruned, each location keeps routes to and from its closest
+        neighbours, plus the routes of a heuristic tour so the LP always has at least one feasible answer.
+
+    # Arguments #
+    :arg distMatrix: a distance matrix of size N x N
+    :type distMatrix: np.ndarray
+    :arg neighbours: how many of the closest locations to keep routes to, None keeps every route
+    :type neighbours: int
+    :arg tour: routes of a known tour to keep instead of solving the heuristic one, ex. the MIP start
+    :type tour: dict
+
+    # Returns #
+    :return arcs: N x N boolean array, True where route i -> j is kept
+    :rtype arcs: np.ndarray
+    """
+    arcs = ~np.eye(len(distMatrix), dtype=bool)
+    if neighbours is None or neighbours >= len(distMatrix) - 1:
+        return arcs
+    kept = nearestArcs(distMatrix, neighbours)
+    for i, j in (tour or solveHeuristic(distMatrix)).items():
+        kept[i, j] = True
+    return kept & arcs
+
+# Each section of the LP file is a generator of text chunks, one chunk per location, so the file can be streamed out
+# without ever holding all N**2 terms in memory at once. Variable names are slices of the shared arrays from Arcs, made
+# once per N, rather than formatted again for every route
+def lpObjective(distMatrix:np.ndarray, arcs:np.ndarray):
+    """ Yields the objective section of the LP file, one chunk per starting location
+
+    # Arguments #
+    :arg distMatrix: a distance matrix of size N x N
+    :type distMatrix: np.ndarray
+    :arg arcs: N x N boolean array of the routes in the model, from pruneArcs
+    :type arcs: np.ndarray
+    """
+    yield 'Min \n'
+    names = arcNames(len(distMatrix))
+    first = True
+    for i in range(len(distMatrix)):
+        columns = np.flatnonzero(arcs[i] & (distMatrix[i] != 0))
+        if len(columns):
+            # Coefficients go through Python floats, so they print exactly as repr does
+            yield ('' if first else ' + ') + ' + '.join([f'{d} {name}' for d, name in zip(distMatrix[i, columns].tolist(), names[i, columns].tolist())])
+            first = False
+    yield ' '
+
+def lpAssignments(constraintMatrix:sparse.csr_matrix, NumElements:int, arcs:np.ndarray):
+    """ Yields the one route in / one route out constraints, one row of the constraint matrix at a time
+
+    # Arguments #
+    :arg constraintMatrix: the sparse constraint matrix from generateContraintMatrix
+    :type constraintMatrix: sparse.csr_matrix
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+    :arg arcs: N x N boolean array of the routes in the model, from pruneArcs
+    :type arcs: np.ndarray
+    """
+    yield '\nsubject to \n'
+    kept = arcs.ravel()
+    names = arcNames(NumElements).ravel()
+    # Each row of the sparse matrix lists its nonzero columns directly, so read those instead of checking every cell
+    for row in range(2 * NumElements):
+        columns = constraintMatrix.indices[constraintMatrix.indptr[row]:constraintMatrix.indptr[row + 1]]
+        columns = columns[kept[columns]]
+        yield ' + '.join(names[columns].tolist()) + ' = 1 \n'
+
+def lpSubtours(NumElements:int, arcs:np.ndarray):
+    """ Yields the indicator constraints for subtour elimination, one starting location at a time
+
+    # Arguments #
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+    :arg arcs: N x N boolean array of the routes in the model, from pruneArcs
+    :type arcs: np.ndarray
+    """
+    names, t = arcNames(NumElements), subtourNames(NumElements)
+    count = 0
+    for i in range(NumElements):
+        columns = np.flatnonzero(arcs[i])
+        labels = range(count, count + len(columns))
+        if i == 0:
+            # Set i == 0 as the first location visited
+            yield ''.join([f'\nGC{c}: {name} = 1 -> t0 = 1' for c, name in zip(labels, names[i, columns].tolist())])
+        else:
+            # Rest of the subtour elimination clause
+            yield ''.join([f'\nGC{c}: {name} = 1 -> {t[i]} - {tj} >= 1' for c, name, tj in zip(labels, names[i, columns].tolist(), t[columns].tolist())])
+        count += len(columns)
+
+def lpMTZ(NumElements:int, arcs:np.ndarray):
+    """ Yields linear Miller-Tucker-Zemlin subtour elimination, t_i - t_j + N x_ij <= N - 1 for every route between two
+        locations that aren't the start. Most MIP solvers handle these much faster than indicator constraints.
+
+    # Arguments #
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+    :arg arcs: N x N boolean array of the routes in the model, from pruneArcs
+    :type arcs: np.ndarray
+    """
+    names, t = arcNames(NumElements), subtourNames(NumElements)
+    count = 0
+    for i in range(1, NumElements):
+        columns = np.flatnonzero(arcs[i, 1:]) + 1
+        labels = range(count, count + len(columns))
+        yield ''.join([f'\nMTZ{c}: {t[i]} - {tj} + {NumElements} {name} <= {NumElements - 1}' for c, tj, name in zip(labels, t[columns].tolist(), names[i, columns].tolist())])
+        count += len(columns)
+
+def lpDeclarations(NumElements:int, arcs:np.ndarray, formulation:str='indicator'):
+    """ Yields the bounds, binary, and integer variable sections of the LP file
+
+    # Arguments #
+    :arg NumElements: number of locations, N
+    :type NumElements: int
+    :arg arcs: N x N boolean array of the routes in the model, from pruneArcs
+    :type arcs: np.ndarray
+    :arg formulation: 'indicator' or 'mtz', which subtour variables to declare
+    :type formulation: str
+    """
+    names, t = arcNames(NumElements), subtourNames(NumElements).tolist()
+    # Define Subtour Variable Bounds
+    yield '\nbounds \n'
+    if formulation == 'mtz':
+        # t is the position in the tour, and continuous is enough for MTZ
+        yield ''.join([f'1 <= {ti} <= {NumElements - 1} \n' for ti in t[1:]])
+    else:
+        yield ''.join([f'0 <= {ti} <= {NumElements} \n' for ti in t])
+    # Define Variable Types
+    yield 'bin \n'
+    for i in range(NumElements):
+        columns = np.flatnonzero(arcs[i])
+        if len(columns):
+            yield ' '.join(names[i, columns].tolist()) + ' '
+    if formulation != 'mtz':
+        yield '\nint \n'
+        yield ' '.join(t) + ' '
+    yield '\nEND'
+
+def lpMipStart(routes:dict, arcs:np.ndarray, path:str, formulation:str='indicator') -> str:
+    """ Writes a known tour as a CPLEX MIP start (.mst), so the solver begins from it instead of from nothing. Every route
+        variable in the model is set, and the subtour variables are numbered to satisfy the formulation's constraints
+
+    # Arguments #
+    :arg routes: each location mapped to the location visited after it, ex. the last tour from repairTour
+    :type routes: dict
+    :arg arcs: N x N boolean array of the routes in the model, from pruneArcs. Must include every route of the tour
+    :type arcs: np.ndarray
+    :arg path: where to write the file
+    :type path: str
+    :arg formulation: 'indicator' or 'mtz', the formulation of the LP file the start is for
+    :type formulation: str
+
+    # Returns #
+    :return path: Where the MIP start was written
+    :rtype path: str
+    """
+    NumElements = len(arcs)
+    order = routesToOrder(routes)
+    position = np.empty(NumElements, dtype=int)
+    position[order] = np.arange(NumElements)
+    if formulation == 'mtz':
+        # t counts up along the tour, 1 for the first stop after location 0
+        subtour = {i: int(position[i]) for i in range(1, NumElements)}
+    else:
+        # t counts down along the tour to 2 for the last stop, with location 0 pinned at 1
+        subtour = {i: int(NumElements - position[i] + 1) if i != 0 else 1 for i in range(NumElements)}
+    chosen = np.zeros((NumElements, NumElements), dtype=bool)
+    chosen[list(routes.keys()), list(routes.values())] = True
+    names, t = arcNames(NumElements), subtourNames(NumElements)
+    with open(path, 'w') as f:
+        f.write('<?xml version = "1.0" encoding="UTF-8" standalone="yes"?>\n<CPLEXSolutions version="1.2">\n <CPLEXSolution version="1.2">\n')
+        f.write(f'  <header problemName="{os.path.splitext(os.path.basename(path))[0]}.lp" solutionName="m1" MIPStartEffortLevel="0" writeLevel="1"/>\n  <variables>\n')
+        index = 0
+        for i in range(NumElements):
+            columns = np.flatnonzero(arcs[i])
+            f.writelines([f'   <variable name="{name}" index="{index + k}" value="{value:d}"/>\n'
+                          for k, (name, value) in enumerate(zip(names[i, columns].tolist(), chosen[i, columns].tolist()))])
+            index += len(columns)
+        f.writelines([f'   <variable name="{t[i]}" index="{index + k}" value="{value}"/>\n' for k, (i, value) in enumerate(subtour.items())])
+        f.write('  </variables>\n </CPLEXSolution>\n</CPLEXSolutions>\n')
+    return path
+
+def lpGenerator(distMatrix:np.ndarray, constraintMatrix:sparse.csr_matrix, filename:str, compress:bool=False, bufferSize:int=2**20, formulation:str='indicator', neighbours:int=None, start:dict=None) -> str:
     """ Writes the lp file for the constraint matrix. LP Files are the way we give the solver our problem.
+        Sections are streamed straight into a buffered file handle, so memory stays at about one row of terms.
 
     # Arguments #
     :arg distMatrix: a distance matrix of size N x N. This contains the necessary objective information
     :type distMatrix: np.ndarray
-    :arg constraintMatrix: the constraint matrix with binary variables
-    :type constraintMatrix: np.ndarray
+    :arg constraintMatrix: the sparse constraint matrix with binary variables, from generateContraintMatrix
+    :type constraintMatrix: sparse.csr_matrix
     :arg filename: input filename that we will make the associated lp file for
     :type filename: str
+    :arg compress: write LPFiles/<filename>.lp.gz with gzip instead of a plain .lp file
+    :type compress: bool
+    :arg bufferSize: size in bytes of the write buffer
+    :type bufferSize: int
+    :arg formulation: subtour elimination, 'indicator' constraints or linear 'mtz' constraints
+    :type formulation: str
+    :arg neighbours: only keep routes between each location and this many of its closest neighbours, None keeps them all
+    :type neighbours: int
+    :arg start: routes of a known tour, ex. the previous one, also written as a MIP start to LPFiles/<filename>.mst
+    :type start: dict
+
+    # Returns #
+    :return full_lp_filename: Where the LP file was written
+    :rtype full_lp_filename: str
     """
+    if formulation not in ('indicator', 'mtz'):
+        raise ValueError(f'Unknown formulation "{formulation}", pick indicator or mtz')
     path = os.getcwd()
     # Define where the LP file should be
-    lp_filename = os.path.splitext(filename)[0] + ".lp"
+    lp_filename = os.path.splitext(filename)[0] + (".lp.gz" if compress else ".lp")
     # Check for if the parent folder exists, if not make one
-    if not os.path.exists(os.path.join(path,"LPFiles")):
-        os.mkdir(os.path.join(path,"LPFiles"))
+    os.makedirs(os.path.join(path,"LPFiles"), exist_ok=True)
     full_lp_filename = os.path.join(path,"LPFiles",lp_filename)
     # Delete old lp file of same name
     if os.path.exists(full_lp_filename):
         os.remove(full_lp_filename)
 
-    # Find N
+    # Find N, and which routes the model gets to use
     NumElements = len(distMatrix)
-
-    # Variable Creation
-    subtour_vars = {}
-    vars_dict = {}
-    for i in range(NumElements):
-        subtour_vars[i] = f't{i}'
-        vars_dict[i] = {}
-        for j in range(NumElements):
-            vars_dict[i][j] = f'i{i}j{j}'
-    subtour_total = 0
-    for i in range(NumElements):
-        subtour_total += i
-    # -------------- Objective Writing -------------- #
-    costs = []
-    for i in vars_dict.keys():
-        for j in vars_dict[i].keys():
-            cost = distMatrix[i, j]
-            if cost != 0.0:
-                costs.append(f'{cost} {vars_dict[i][j]}')
-                costs.append('+')
-    costs.pop()
-    # -------------- Constraint Writing -------------- #
-    lp_constraints = []
-    # Top Third (One route in)
-    loc = 0
-    for i in vars_dict.keys():
-        local = []
-        for j in vars_dict[i].keys():
-            if i != j:
-                if constraintMatrix[i,j+loc] == 1.0:
-                    local.append(vars_dict[i][j])
-                    local.append(' + ')
-        local.pop()
-        lp_constraints.append(local)
-        loc += NumElements
-    # Second Third (One route out)
-    loc = 0
-    for i in vars_dict.keys():
-        local = []
-        for j in vars_dict[i].keys():
-            if i != j:
-                if constraintMatrix[i+NumElements,j*NumElements+loc] == 1.0:
-                    local.append(vars_dict[j][i])
-                    local.append(' + ')
-        local.pop()
-        lp_constraints.append(local)
-        loc += 1
-    # Bottom Third (Subtour elimination)
-    subtours =[]
-    for i in vars_dict.keys():
-        for j in vars_dict[i].keys():
-            if i != j:
-                if i == 0:
-                    # Set i == 0 as the first location visited
-                    subtours.append(f'{vars_dict[i][j]} = 1 -> {subtour_vars[i]} = 1')
-                else:
-                    # Rest of the subtour elimination clause
-                    subtours.append(f'{vars_dict[i][j]} = 1 -> {subtour_vars[i]} - {subtour_vars[j]} >= 1')
-    subtour_final = []
-    for i in subtour_vars.keys():
-        subtour_final.append(i)
-        subtour_final.append(' + ')
-    subtour_final.pop()
-    subtour_final.append(f'= {subtour_total}')
+    arcs = pruneArcs(distMatrix, neighbours, start)
 
     # Write the LP file
-    with open(full_lp_filename, 'x') as lp:
+    if compress:
+        lp = io.TextIOWrapper(io.BufferedWriter(gzip.open(full_lp_filename, 'xb', compresslevel=6), bufferSize))
+    else:
+        lp = open(full_lp_filename, 'x', buffering=bufferSize)
+    with lp:
         # Objective Section
-        lp.write('Min \n')
-        for eq in costs:
-            lp.write(f'{eq} ')
+        lp.writelines(lpObjective(distMatrix, arcs))
         # Constraint Section
-        lp.write('\nsubject to \n')
-        for eq in lp_constraints:
-            for i in eq:
-                lp.write(i)
-            lp.write(' = 1 \n')        
-        count = 0
-        for i in subtours:
-            lp.write(f'\nGC{count}: {i}')
-            count += 1
-        for i in subtour_final:
-            lp.write(f'{i}')
-        # Define Subtour Variable Bounds
-        lp.write('\nbounds \n')
-        for i in subtour_vars.keys():
-            lp.write(f'0 <= {subtour_vars[i]} <= {NumElements} \n')
-        # Define Variable Types
-        lp.write('bin \n')
-        for i in vars_dict.keys():
-            for j in vars_dict[i].keys():
-                if i != j:
-                    lp.write(f'{vars_dict[i][j]} ')
-        lp.write('\nint \n')
-        for i in subtour_vars.keys():
-            lp.write(f'{subtour_vars[i]} ')
-        lp.write('\nEND')
\ No newline at end of file
+        lp.writelines(lpAssignments(constraintMatrix, NumElements, arcs))
+        if formulation == 'mtz':
+            lp.writelines(lpMTZ(NumElements, arcs))
+        else:
+            lp.writelines(lpSubtours(NumElements, arcs))
+        # Bounds and Variable Types
+        lp.writelines(lpDeclarations(NumElements, arcs, formulation))
+    if start is not None:
+        lpMipStart(start, arcs, os.path.join(path, "LPFiles", os.path.splitext(filename)[0] + ".mst"), formulation)
+    return full_lp_filename
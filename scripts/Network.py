@@ -0,0 +1,115 @@
+# Import Statements
+import json
+import os
+import threading
+import time
+from scripts.Profiler import recordCall
+
+# -------------------------------------- Shared HTTP Helpers -------------------------------------- #
+
+class RateLimiter:
+    """ Spaces out calls so that no more than `rate` of them start each second, across every thread that shares it
+
+    # Arguments #
+    :arg rate: Maximum calls per second. None or 0 turns the limiter off
+    :type rate: float
+    """
+    def __init__(self, rate:float=None):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next = time.monotonic()
+
+    def wait(self) -> None:
+        """ Blocks until the caller is allowed to make its call """
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next, now)
+            self.next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def makeSession(poolSize:int=8) -> 'requests.Session':
+    """ Makes one requests Session with a connection pool big enough for every worker thread, so connections get reused
+
+    # Arguments #
+    :arg poolSize: How many connections to keep open per host, should match the number of threads
+    :type poolSize: int
+
+    # Returns #
+    :return session: Pooled session
+    :rtype session: requests.Session
+    """
+    # requests takes a tenth of a second to import, only pay for it once something is actually fetched
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def getJSON(session:'requests.Session', url:str, limiter:RateLimiter=None, retries:int=3, backoff:float=0.5, timeout:float=30) -> dict:
+    """ GET a url and decode the JSON, retrying connection errors, 429s, and 5xx responses with exponential backoff
+
+    # Arguments #
+    :arg session: Session to make the call with
+    :type session: requests.Session
+    :arg url: Full url, including the query string
+    :type url: str
+    :arg limiter: Shared rate limiter, waited on before every attempt
+    :type limiter: RateLimiter
+    :arg retries: How many times to retry after the first attempt fails
+    :type retries: int
+    :arg backoff: Seconds to wait before the first retry, doubled every retry after that
+    :type backoff: float
+    :arg timeout: Seconds to wait for the server before giving up on an attempt
+    :type timeout: float
+
+    # Returns #
+    :return retVal: Decoded JSON response
+    :rtype retVal: dict
+    """
+    import requests
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=timeout)
+            recordCall(url, time.perf_counter() - start, response.ok)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response.json()
+            error = requests.HTTPError(f'{response.status_code} from {response.url}', response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            recordCall(url, time.perf_counter() - start, False)
+            error = e
+        if attempt < retries:
+            time.sleep(backoff * 2**attempt)
+    raise error
+
+
+def loadKeys(path:str='Keys.json') -> dict:
+    """ Reads the API keys. A missing Keys.json is fine, and an environment variable like TOMTOM_KEY or GOOGLEMAPS_KEY
+        overrides the key of the same name, so scheduled runs don't need the file at all
+
+    # Arguments #
+    :arg path: Keys file, relative to where the program is run from
+    :type path: str
+
+    # Returns #
+    :return keys: Key names, ex. googleMaps, TomTom, MapBox, mapped to their keys. Keys that were never set are left out
+    :rtype keys: dict
+    """
+    keys = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            keys = json.load(f)
+    for name in set(keys) | {'googleMaps', 'TomTom', 'MapBox'}:
+        if os.environ.get(f'{name.upper()}_KEY'):
+            keys[name] = os.environ[f'{name.upper()}_KEY']
+    return keys
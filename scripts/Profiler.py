@@ -0,0 +1,167 @@
+# Import Statements
+import contextlib
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+import numpy as np
+
+# -------------------------------------- Profiling the Pipeline -------------------------------------- #
+
+# The profiler currently collecting, if any. Module level so code deep in the pipeline can report to it without
+# having it passed down through every call
+_active = None
+
+
+class Profiler:
+    """ Collects where the time goes in one run of the pipeline: wall and CPU time of each stage, optionally peak
+        memory and a cProfile dump per stage, plus counters (ex. cache hits) and API call latencies from any thread.
+        Use it as a context manager to make it the active profiler, then wrap each stage in profiler.stage(name).
+
+    # Arguments #
+    :arg trace: Also measure peak memory of each stage with tracemalloc, which slows Python down a lot
+    :type trace: bool
+    :arg cprofileDir: Folder to dump a cProfile .prof file into for each top level stage, None turns it off
+    :type cprofileDir: str
+    """
+    def __init__(self, trace:bool=False, cprofileDir:str=None):
+        self.trace = trace
+        self.cprofileDir = cprofileDir
+        self.stages = []
+        self.counters = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+        # Open stages, innermost last, with the highest traced memory seen in each so far
+        self.open = []
+        self.previous = None
+        self.startedTracing = False
+
+    def __enter__(self):
+        global _active
+        self.previous, _active = _active, self
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.startedTracing = True
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self.previous
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+
+    @contextlib.contextmanager
+    def stage(self, name:str):
+        """ Times the with block as one stage. Stages can nest, an inner stage is named outer/inner
+
+        # Arguments #
+        :arg name: Name of the stage
+        :type name: str
+        """
+        path = f"{self.open[-1]['name']}/{name}" if self.open else name
+        entry = {'name': path}
+        tracing = self.trace and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # Stages further out still need to know about the peak that is about to be reset
+            for outer in self.open:
+                outer['peak'] = max(outer['peak'], peak)
+            tracemalloc.reset_peak()
+            entry['start'], entry['peak'] = current, current
+        profile = None
+        # Only one cProfile can run at a time, so only top level stages get one
+        if self.cprofileDir and not self.open:
+            profile = cProfile.Profile()
+        self.open.append(entry)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            if profile is not None:
+                profile.disable()
+            record = {'name': path, 'wall (s)': time.perf_counter() - wall, 'cpu (s)': time.process_time() - cpu, 'failed': failed}
+            self.open.pop()
+            if tracing:
+                peak = max(entry['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak (MB)'] = (peak - entry['start']) / 2**20
+                if self.open:
+                    self.open[-1]['peak'] = max(self.open[-1]['peak'], peak)
+            if profile is not None:
+                os.makedirs(self.cprofileDir, exist_ok=True)
+                record['cprofile'] = os.path.join(self.cprofileDir, re.sub(r'\W', '_', path) + '.prof')
+                profile.dump_stats(record['cprofile'])
+            self.stages.append(record)
+
+    def count(self, name:str, value:int=1) -> None:
+        """ Adds to a named counter, safe to call from any thread """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def recordCall(self, endpoint:str, seconds:float, ok:bool) -> None:
+        """ Remembers how long one API call took, and whether it worked, safe to call from any thread """
+        with self.lock:
+            calls = self.calls.setdefault(endpoint, {'latencies': [], 'failed': 0})
+            calls['latencies'].append(seconds)
+            calls['failed'] += not ok
+
+    def report(self) -> dict:
+        """ Everything collected so far, ready to be saved as JSON
+
+        # Returns #
+        :return report: stages in the order they finished, counters, cache hit rates, and API call statistics
+        :rtype report: dict
+        """
+        hitRates = {}
+        for name in self.counters:
+            if name.endswith(' hits'):
+                cache = name[:-len(' hits')]
+                total = self.counters[name] + self.counters.get(f'{cache} misses', 0)
+                hitRates[cache] = self.counters[name] / total if total else None
+        calls = {}
+        for endpoint, record in self.calls.items():
+            latencies = np.array(record['latencies']) * 1000
+            calls[endpoint] = {'calls': len(latencies), 'failed': record['failed'], 'mean (ms)': float(latencies.mean()),
+                               'p50 (ms)': float(np.percentile(latencies, 50)), 'p95 (ms)': float(np.percentile(latencies, 95)),
+                               'max (ms)': float(latencies.max())}
+        return {'stages': self.stages, 'counters': dict(self.counters), 'hit rates': hitRates, 'api calls': calls}
+
+    def save(self, path:str) -> dict:
+        """ Writes the report to a JSON file, and returns it """
+        report = self.report()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+        return report
+
+
+def stage(name:str):
+    """ Times a with block as a stage of the active profiler, or does nothing when nothing is being profiled """
+    return _active.stage(name) if _active is not None else contextlib.nullcontext()
+
+
+def count(name:str, value:int=1) -> None:
+    """ Adds to a counter of the active profiler, if there is one """
+    if _active is not None:
+        _active.count(name, value)
+
+
+def recordCall(url:str, seconds:float, ok:bool) -> None:
+    """ Reports an API call to the active profiler, if there is one. Calls are grouped by host and the leading words of
+        the path, so the coordinates or addresses in a url don't make every call its own endpoint
+    """
+    if _active is not None:
+        parts = urlsplit(url)
+        words = []
+        for segment in parts.path.split('/')[1:]:
+            if not re.fullmatch(r'[A-Za-z_]+', segment):
+                break
+            words.append(segment)
+        _active.recordCall('/'.join([parts.netloc] + words), seconds, ok)
@@ -1,154 +1,413 @@
 # Import statements
-from bs4 import BeautifulSoup as bs
 import numpy as np
-import pandas as pd
-import requests
-import json
+import hashlib
 import os
-import plotly as plt
-import plotly.graph_objects as go
+from operator import itemgetter
+import re
+from xml.parsers import expat
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scripts.Arcs import arcEnds, decodeArcs
+from scripts.Network import RateLimiter, makeSession, getJSON, loadKeys
+from scripts.Profiler import count
+from scripts.Solver import routesToOrder, successorCycles
 
 filename = 'AddressesFull'
-MAP_PATH = MAP_PATH = os.path.join(os.getcwd(), "Maps")
-
-with open(os.path.join(os.getcwd(), 'Keys.json')) as f:
-    keys = json.load(f)
-TomTomKey = keys['TomTom']
-MapBoxKey = keys['MapBox']
+# Relative to wherever the program is run from, worked out when they are used rather than when this is imported
+MAP_PATH = "Maps"
 
 # -------------------------------------- Interpreting the Solution -------------------------------------- #
 
 
+# Only these variables are ever needed back out of a solution, the route variables and the subtour order
+SOL_VARIABLE = re.compile(r'i\d+j\d+|t\d+')
+
 def solParser(distMatrix: np.ndarray, filename: str) -> dict:
-    """ Read the .sol file and return a much easier to work with dictionary over this xml jargon
+    """ Read the .sol file and return a much easier to work with dictionary over this xml jargon.
+        The file is streamed once, and every element is thrown away as soon as it has been read.
 
     # Arguments #
-    :arg distMatrix: 
+    :arg distMatrix: Only used to check the solution has the right number of locations
+    :type distMatrix: np.ndarray
     :arg filename: Generic name of the input data file
     :type filename: str
 
     # Returns #
-    :ret solution: Usable solution in dictionary form
+    :ret solution: Route variables that are nonzero, and every subtour variable, mapped to their values
     :rtype solution: dict
     """
-    # Load solution file
-    with open(os.path.join(os.getcwd(), 'sol', filename+'.sol'), 'r') as f:
-        data = f.read()
-    BS_Data = bs(data, 'xml')
-    # Get N from distMatrix
     NumElements = len(distMatrix)
+    # Almost every route variable is a plain "0", so those are dropped as they stream past without building an element
+    # or parsing a float. The few left over are checked properly afterwards
+    candidates = []
+    def startElement(tag, attributes):
+        if tag == 'variable':
+            name, value = attributes.get('name', ''), attributes.get('value', '0')
+            if value != '0' or name[:1] == 't':
+                candidates.append((name, value))
+    parser = expat.ParserCreate()
+    parser.buffer_size = 2**20
+    parser.StartElementHandler = startElement
+    with open(os.path.join(os.getcwd(), 'sol', filename+'.sol'), 'rb') as f:
+        parser.ParseFile(f)
     solution = {}
-    for i in range(NumElements):
-        for j in range(NumElements):
-            val = BS_Data.find('variable', {'name': f'i{i}j{j}'})
-            if val != None:
-                solution[val.get('name')] = val.get('value')
+    for name, value in candidates:
+        if SOL_VARIABLE.fullmatch(name):
+            value = float(value)
+            if value != 0 or name[0] == 't':
+                solution[name] = value
+    if len([name for name in solution if name[0] == 'i']) > NumElements:
+        print(f'Warning: {filename}.sol has more routes than the {NumElements} locations in the distance matrix')
     return solution
 
 
-def solInterpreter(sol: dict, distMatrix: np.ndarray, filename: str) -> dict:
-    """ Takes a solution and outputs the route to the terminal
+def solSuccessor(sol: dict, NumElements: int) -> np.ndarray:
+    """ Builds the successor array of a parsed solution, from its route variables that are switched on
+
+    # Arguments #
+    :arg sol: Variables and values from solParser
+    :type sol: dict
+    :arg NumElements: Number of locations, N
+    :type NumElements: int
+
+    # Returns #
+    :ret successor: successor[i] is the location visited after i, -1 if the solution never leaves i
+    :rtype successor: np.ndarray
+    """
+    successor = np.full(NumElements, -1, dtype=np.int64)
+    arcs = decodeArcs(sol.keys(), NumElements)
+    on = (arcs >= 0) & (np.round(np.fromiter(sol.values(), dtype=float, count=len(sol))) == 1)
+    i, j = arcEnds(arcs[on], NumElements)
+    # Same as setting them one at a time, if i appears twice the later route wins
+    successor[i] = j
+    return successor
+
+
+def solInterpreter(sol: dict, distMatrix: np.ndarray, filename: str, df: 'pd.DataFrame' = None) -> dict:
+    """ Takes a solution and outputs the route to the terminal. The route is followed stop by stop from location 0,
+        and any subtours or locations left out are reported
 
     # Arguments #
     :arg sol: All of the route variables and associated values for the solution
     :type sol: dict
-    :arg distMatrix: Used to get how many locations there are
+    :arg distMatrix: Distances, used for the length of the route
     :type distMatrix: np.ndarray
-    :arg filename: Generic name of the input data file
+    :arg filename: Generic name of the input data file, only read if df isn't given
     :type filename: str
+    :arg df: The locations, with their names in a Name column
+    :type df: pd.DataFrame
 
     # Returns #
-    :ret routes: The start- and end-points of each route
+    :ret routes: The start- and end-points of each route, in the order they are driven
     :rtype routes: dict
     """
-    # Get names of locations
-    with open(os.path.join(os.getcwd(), 'Data', filename+'.csv'), "r") as data:
-        df = pd.read_csv(data)
+    if df is None:
+        import pandas as pd
+        # Get names of locations
+        with open(os.path.join(os.getcwd(), 'Data', filename+'.csv'), "r") as data:
+            df = pd.read_csv(data)
+    names = (df['Name'] if 'Name' in df.columns else df.iloc[:, 1]).to_numpy()
     NumElements = len(distMatrix)
-    routes = {}
+    successor = solSuccessor(sol, NumElements)
+    cycles, stranded = successorCycles(successor)
     print('# ---------- Interpreting Solution ---------- #')
-    # Get the solution in order, ease of read
-    for i in range(NumElements):
-        for j in range(NumElements):
-            loc = f'i{i}j{j}'
-            if loc in sol.keys() and int(sol[loc]) == 1:
-                routes[i] = j
-    stop = 0
-    i = 0
-
-    # Print solution to terminal
-    for loc in routes.keys():
-        if stop != loc:
-            print(
-                f'Route contains {df.iloc[routes[stop], 1]} -> {df.iloc[routes[loc], 1]}')
-            stop = loc
-        elif i != 0:
-            print(f'Possible circular route: {loc} -> {stop}, at index {i}')
-        i += 1
+    # Print solution to terminal, following the route from location 0
+    for cycle in cycles:
+        if cycle[0] != 0:
+            print(f'Subtour of {len(cycle)} stops:')
+        for i in cycle:
+            print(f'Route contains {names[i]} -> {names[successor[i]]}')
+    left = successor >= 0
+    length = float(np.asarray(distMatrix)[np.flatnonzero(left), successor[left]].sum())
     # Verify solution is legit
-    if i == NumElements:
-        print(
-            f'Route contains {i} stops out of {NumElements} locations, and is indeed circular!')
+    if len(cycles) == 1 and len(cycles[0]) == NumElements:
+        print(f'Route contains {NumElements} stops out of {NumElements} locations, and is indeed circular! Total distance {length:.2f}')
     else:
-        print(
-            f'Route is not circular, as there are {i} stops and {NumElements} locations')
+        print(f'Route is not one circular tour: {len(cycles)} cycles of {", ".join(str(len(cycle)) for cycle in cycles) or "no"} stops,'
+              f' and {len(stranded)} locations on none of them {stranded.tolist()}')
+    routes = {int(i): int(successor[i]) for cycle in cycles for i in cycle}
+    routes.update({int(i): int(successor[i]) for i in stranded if successor[i] >= 0})
     print(routes)
     return routes
 
 
+def fleetInterpreter(fleet: list, distMatrix: np.ndarray, df: 'pd.DataFrame', depot: int = 0) -> np.ndarray:
+    """ Puts a fleet from solveFleet out to the terminal, one vehicle at a time, and checks every location other than
+        the depot is visited by exactly one vehicle
+
+    # Arguments #
+    :arg fleet: One routes dictionary per vehicle
+    :type fleet: list
+    :arg distMatrix: Distances, used for the length of each route
+    :type distMatrix: np.ndarray
+    :arg df: The locations, with their names in a Name column
+    :type df: pd.DataFrame
+    :arg depot: Location every vehicle starts and ends at
+    :type depot: int
+
+    # Returns #
+    :ret lengths: The distance driven by each vehicle
+    :rtype lengths: np.ndarray
+    """
+    names = (df['Name'] if 'Name' in df.columns else df.iloc[:, 1]).to_numpy()
+    NumElements = len(distMatrix)
+    distMatrix = np.asarray(distMatrix)
+    visits = np.zeros(NumElements, dtype=int)
+    lengths = np.zeros(len(fleet))
+    print('# ---------- Interpreting Fleet ---------- #')
+    for vehicle, routes in enumerate(fleet):
+        lengths[vehicle] = distMatrix[list(routes.keys()), list(routes.values())].sum()
+        visits[list(routes.keys())] += 1
+        print(f'Vehicle {vehicle + 1}: {len(routes) - 1} stops, total distance {lengths[vehicle]:.2f}')
+        if depot not in routes:
+            print('    Never goes through the depot')
+            continue
+        order = routesToOrder(routes, depot)
+        print('    ' + ' -> '.join(str(names[i]) for i in np.append(order, depot)))
+        if len(order) != len(routes) or routes[int(order[-1])] != depot:
+            print(f'    Not one circular tour, only {len(order)} of its {len(routes)} stops are on the tour through the depot')
+    # Verify solution is legit
+    wrong = visits != 1
+    wrong[depot] = False
+    missed = np.flatnonzero(wrong)
+    if len(missed) == 0:
+        print(f'{len(fleet)} vehicles visit all {NumElements - 1} stops exactly once! Total distance {lengths.sum():.2f}')
+    else:
+        print(f'Stops not visited exactly once: {", ".join(f"{names[i]} ({visits[i]} times)" for i in missed)}')
+    return lengths
+
+
 # -------------------------------------- Graphing the Solution -------------------------------------- #
 
-def APIMANAGER(js: str) -> pd.DataFrame:
-    jsDump = json.dumps(js)
-    jsLoad = json.loads(jsDump)
-    points = jsLoad['routes'][0]['legs'][0]['points']
-    coords = []
-    for item in points:
-        coords.append([float(item['longitude']), float(item['latitude'])])
-    loc_df = pd.DataFrame(coords, columns=['Longitude', 'Latitude'])
-    return loc_df
-
-def routeGenerator(startLat: float, startLon: float, endLat: float, endLon: float, apiKey: str) -> pd.DataFrame:
-    tomtomURL = f'https://api.tomtom.com/routing/1/calculateRoute/{startLat},{startLon}:{endLat},{endLon}/json?maxAlternatives=0&routeType=shortest&travelMode=bicycle&key={apiKey}'
-    getData = requests.get(tomtomURL)
-    while (getData.status_code != 200):
-        getData = requests.get(tomtomURL)
-    jsonTomTomString = getData.json()
-    start = pd.DataFrame({'Latitude':startLat,'Longitude':startLon}, index =[0])
-    df = APIMANAGER(jsonTomTomString)
-    end = pd.DataFrame({'Latitude':endLat,'Longitude':endLon}, index =[0])
-    df = pd.concat([start,df[:],end]).reset_index(drop = True)
-    return df
-
-
-def GenerateMapSolutions(sol: dict, dataframe: pd.DataFrame, apiKey: str) -> dict:
-    """Creates a pandas dataframe that represents a solution from the response given by a .sol file
+def APIMANAGER(js: dict) -> np.ndarray:
+    """Pulls the points of a TomTom route response straight into an array, in one pass
+
+    # Arguments #
+    :arg js: decoded JSON response from the TomTom routing API
+    :type js: dict
+
+    # Returns #
+    :return: N x 2 float64 array of (Latitude, Longitude) points
+    :rtype: np.ndarray
+    """
+    points = js['routes'][0]['legs'][0]['points']
+    return np.fromiter(map(itemgetter('latitude', 'longitude'), points), dtype=np.dtype((np.float64, 2)), count=len(points))
+
+TOMTOM_URL = 'https://api.tomtom.com/routing/1/calculateRoute'
+ROUTE_CACHE = "CachedRoutes"
+
+def routeGenerator(startLat: float, startLon: float, endLat: float, endLon: float, apiKey: str, session=None, limiter: RateLimiter = None, retries: int = 5, mode: str = 'bicycle', url: str = TOMTOM_URL) -> np.ndarray:
+    """Asks TomTom for the path of one leg, retrying failed calls a bounded number of times with backoff
+
+    # Arguments #
+    :arg startLat: Latitude the leg starts at
+    :type startLat: float
+    :arg startLon: Longitude the leg starts at
+    :type startLon: float
+    :arg endLat: Latitude the leg ends at
+    :type endLat: float
+    :arg endLon: Longitude the leg ends at
+    :type endLon: float
+    :arg apiKey: apiKey for TomTom
+    :type apiKey: str
+    :arg session: Pooled session to reuse connections with, a new one is made if not given
+    :type session: requests.Session
+    :arg limiter: Rate limiter shared with any other threads calling TomTom
+    :type limiter: RateLimiter
+    :arg retries: How many times to retry a failed call before giving up
+    :type retries: int
+    :arg mode: TomTom travelMode
+    :type mode: str
+    :arg url: Routing endpoint, only changed to point at a test server
+    :type url: str
+
+    # Returns #
+    :return: N x 2 array of (Latitude, Longitude) points along the leg, including both ends
+    :rtype: np.ndarray
+    """
+    if session is None:
+        session = makeSession(1)
+    jsonTomTomString = getJSON(session, f'{url}/{startLat},{startLon}:{endLat},{endLon}/json?maxAlternatives=0&routeType=shortest&travelMode={mode}&key={apiKey}', limiter, retries)
+    points = APIMANAGER(jsonTomTomString)
+    # Pin both ends of the leg to the exact locations
+    leg = np.empty((len(points) + 2, 2))
+    leg[0] = startLat, startLon
+    leg[1:-1] = points
+    leg[-1] = endLat, endLon
+    return leg
+
+
+def legCachePath(startLat: float, startLon: float, endLat: float, endLon: float, mode: str, cacheDir: str = ROUTE_CACHE) -> str:
+    """Where the path of one leg is cached, named for a hash of its endpoints and travel mode"""
+    digest = hashlib.sha1(f'{startLat:.6f},{startLon:.6f}:{endLat:.6f},{endLon:.6f}:{mode}'.encode()).hexdigest()
+    return os.path.join(cacheDir, digest + '.npy')
+
+
+def fetchLegs(legs: list, apiKey: str, workers: int = 8, rateLimit: float = 5, retries: int = 5, mode: str = 'bicycle', cacheDir: str = ROUTE_CACHE, url: str = TOMTOM_URL) -> list:
+    """Gets the path of many legs at once. Legs already on disk are read from the cache, the rest are fetched in parallel
+    over one pooled session and saved, so drawing an unchanged tour again makes no calls at all
+
+    # Arguments #
+    :arg legs: (startLat, startLon, endLat, endLon) of every leg
+    :type legs: list
+    :arg apiKey: apiKey for TomTom
+    :type apiKey: str
+    :arg workers: Number of legs fetched at the same time
+    :type workers: int
+    :arg rateLimit: Maximum calls per second to TomTom, across all threads
+    :type rateLimit: float
+    :arg retries: How many times to retry a failed call before giving up
+    :type retries: int
+    :arg mode: TomTom travelMode, part of the cache key
+    :type mode: str
+    :arg cacheDir: Folder the leg paths are cached in
+    :type cacheDir: str
+    :arg url: Routing endpoint, only changed to point at a test server
+    :type url: str
+
+    # Returns #
+    :return: One N x 2 array of (Latitude, Longitude) points per leg, in the same order as legs
+    :rtype: list
+    """
+    os.makedirs(cacheDir, exist_ok=True)
+    paths = [legCachePath(*leg, mode, cacheDir) for leg in legs]
+    retVal = [None] * len(legs)
+    missing = []
+    for index, path in enumerate(paths):
+        if os.path.exists(path):
+            retVal[index] = np.load(path)
+        else:
+            missing.append(index)
+    print(f'{len(legs) - len(missing)} of {len(legs)} legs cached, fetching {len(missing)}')
+    count('route cache hits', len(legs) - len(missing))
+    count('route cache misses', len(missing))
+    if missing:
+        session = makeSession(workers)
+        limiter = RateLimiter(rateLimit)
+        failed, firstError = 0, None
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(routeGenerator, *legs[index], apiKey, session, limiter, retries, mode, url): index for index in missing}
+            for future in as_completed(futures):
+                index = futures[future]
+                # One leg failing doesn't stop the others from being saved, so a rerun only fetches what is still missing
+                try:
+                    retVal[index] = future.result()
+                except Exception as e:
+                    failed += 1
+                    firstError = firstError or e
+                    print(f'Leg {legs[index]} failed, issue: {e}')
+                    continue
+                # Written under a name of this process's own then swapped in, so a crash or another process saving the
+                # same leg never leaves half a file in the cache
+                temporary = f'{paths[index]}.{os.getpid()}.tmp'
+                with open(temporary, 'wb') as f:
+                    np.save(f, retVal[index])
+                os.replace(temporary, paths[index])
+        session.close()
+        if failed:
+            print(f'{failed} of {len(missing)} legs failed, the rest are cached')
+            raise firstError
+    return retVal
+
+
+def GenerateMapSolutions(sol: dict, dataframe: 'pd.DataFrame', apiKey: str, **fetchArgs) -> dict:
+    """Gets the road path of every leg of a solution from a .sol file, as a NumPy array of points per location
 
     # Arguments #
     :arg sol: A full circular route
-    :type response: dict
+    :type sol: dict
     :arg dataframe: A dataframe consisting of at least location Longitude and Latitudes.
     :type dataframe: pd.DataFrame
     :arg apiKey: apiKey for TomTom
     :type apiKey: str
+    :arg fetchArgs: passed on to fetchLegs, ex. workers or cacheDir
+    :type fetchArgs: dict
 
     # Returns #
-    :return: A dataframe which represents a series of points of different coordinates and colors that form a route.
-    :rtype: pd.DataFrame
+    :return: Each location mapped to an N x 2 array of the (Latitude, Longitude) points from it to the next location
+    :rtype: dict
     """
-    retVal = {}
-    for i in sol.keys():
-        startLat = dataframe.iloc[i]["Latitude"].item()
-        startLon = dataframe.iloc[i]["Longitude"].item()
-        endLat = dataframe.iloc[sol[i]]["Latitude"].item()
-        endLon = dataframe.iloc[sol[i]]["Longitude"].item()
-        print((startLat, startLon), "->", (endLat, endLon))
-        retVal[i] = routeGenerator(startLat, startLon, endLat, endLon, apiKey)
-    return retVal
+    latitudes = dataframe["Latitude"].to_numpy(dtype=float)
+    longitudes = dataframe["Longitude"].to_numpy(dtype=float)
+    legs = [(latitudes[i].item(), longitudes[i].item(), latitudes[sol[i]].item(), longitudes[sol[i]].item()) for i in sol.keys()]
+    return dict(zip(sol.keys(), fetchLegs(legs, apiKey, **fetchArgs)))
+
+
+def simplifyLeg(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Drops points from a leg with Douglas-Peucker, keeping every point that is further than tolerance from the line
+    the simplified leg would draw instead
+
+    # Arguments #
+    :arg points: N x 2 array of (Latitude, Longitude) points
+    :type points: np.ndarray
+    :arg tolerance: How far off, in meters, the simplified line may be. None or 0 keeps every point
+    :type tolerance: float
+
+    # Returns #
+    :return: The points that were kept, both ends always included
+    :rtype: np.ndarray
+    """
+    if not tolerance or len(points) < 3:
+        return points
+    # Flatten to meters around the middle of the leg, plenty accurate at city scale
+    xy = np.column_stack((points[:, 1] * 111320 * np.cos(np.radians(points[:, 0].mean())), points[:, 0] * 110540))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        chord = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        squared = chord @ chord
+        # Distance to the segment that would be drawn, not the whole line through it, so a spur or overshoot past
+        # either end is measured from that end
+        along = np.clip(offsets @ chord / squared, 0, 1) if squared > 0 else np.zeros(len(offsets))
+        nearest = offsets - along[:, None] * chord
+        distance = np.hypot(nearest[:, 0], nearest[:, 1])
+        furthest = int(np.argmax(distance))
+        if distance[furthest] > tolerance:
+            middle = start + 1 + furthest
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+    return points[keep]
+
+
+def make_map(pathingList, locations:'pd.DataFrame', mapboxKey:str, sol, tolerance:float=None, singleTrace:bool=False, plotlyjs=True, autoOpen:bool=True, name:str='GeneratedMap') -> str:
+    """Draws the locations and every leg of the route on a Mapbox map, and saves it to Maps/<name>.html. Give a list of
+    routes and a list of their legs to draw a whole fleet, one legend group per vehicle
 
+    # Arguments #
+    :arg pathingList: Each location mapped to the (Latitude, Longitude) points from it to the next location, or a list of those per vehicle
+    :type pathingList: dict or list
+    :arg locations: A dataframe consisting of at least location Name, Longitude, and Latitudes
+    :type locations: pd.DataFrame
+    :arg mapboxKey: API key for Plotly Mapbox
+    :type mapboxKey: str
+    :arg sol: A route dictionary, or a list of them per vehicle like solveFleet returns
+    :type sol: dict or list
+    :arg tolerance: Simplify every leg to within this many meters, None draws every point
+    :type tolerance: float
+    :arg singleTrace: Draw all legs of a route as one trace split by NaNs, instead of one trace per leg
+    :type singleTrace: bool
+    :arg plotlyjs: Passed to plotly as include_plotlyjs. 'directory' writes plotly.min.js once next to the map instead of inside it
+    :type plotlyjs: bool or str
+    :arg autoOpen: Open the map in the browser when done
+    :type autoOpen: bool
+    :arg name: File name of the map, without .html
+    :type name: str
 
-def make_map(pathingList:dict, locations:pd.DataFrame, mapboxKey:str, sol:dict) -> None:
+    # Returns #
+    :return: Where the map was saved
+    :rtype: str
+    """
+    # plotly is only needed to draw, so it isn't imported until something is
+    import plotly as plt
+    import plotly.graph_objects as go
+    fleet = isinstance(sol, list)
+    sols, pathingLists = (sol, pathingList) if fleet else ([sol], [pathingList])
     fig = go.Figure(go.Scattergeo())
     # Plot all locations
     lat = locations['Latitude'].values.tolist()
@@ -158,55 +417,82 @@ def make_map(pathingList:dict, locations:pd.DataFrame, mapboxKey:str, sol:dict)
         lon=lon,
         name='Locations'
     ))
+    names = locations['Name'].to_numpy()
     # Plot all routes
-    for i in pathingList.keys():
-        start = locations.iloc[i]['Name']
-        end = locations.iloc[sol[i]]['Name']
-        fig.add_trace(go.Scattermapbox(
-            mode='lines',
-            lat=pathingList[i]['Latitude'].values.tolist(),
-            lon=pathingList[i]["Longitude"].values.tolist(),
-            name = f'{start} -> {end}'
+    for vehicle, (routes, paths) in enumerate(zip(sols, pathingLists)):
+        legs = {i: simplifyLeg(paths[i], tolerance) for i in paths.keys()}
+        group = dict(legendgroup=f'Vehicle {vehicle + 1}', legendgrouptitle_text=f'Vehicle {vehicle + 1}') if fleet else {}
+        if singleTrace:
+            # A row of NaNs between legs breaks the line, so the whole route is one trace
+            gap = np.full((1, 2), np.nan)
+            route = np.concatenate([part for leg in legs.values() for part in (leg, gap)][:-1])
+            fig.add_trace(go.Scattermapbox(
+                mode='lines',
+                lat=route[:, 0],
+                lon=route[:, 1],
+                name=f'Vehicle {vehicle + 1}' if fleet else 'Route',
+                **group
+                )
             )
-        )
+        else:
+            for i in legs.keys():
+                fig.add_trace(go.Scattermapbox(
+                    mode='lines',
+                    lat=legs[i][:, 0],
+                    lon=legs[i][:, 1],
+                    name = f'{names[i]} -> {names[routes[i]]}',
+                    **group
+                    )
+                )
 
     # Using Mapbox
     fig.update_layout(mapbox_style="open-street-map")
     fig.update_layout(mapbox_style="light", mapbox_accesstoken=mapboxKey)
     # Display map
-    plt.offline.plot(
+    return plt.offline.plot(
         fig,
-        filename=os.path.join(os.getcwd(), "Maps", f"GeneratedMap.html"),
-        auto_open=True,
+        filename=os.path.join(os.getcwd(), "Maps", f"{name}.html"),
+        auto_open=autoOpen,
+        include_plotlyjs=plotlyjs,
     )
 
 
-def ShowMapSolutions(sol: dict, dataframe: pd.DataFrame, TomTomKey: str, MapBoxKey: str):
+def ShowMapSolutions(sol, dataframe: 'pd.DataFrame', TomTomKey: str = None, MapBoxKey: str = None, **mapArgs):
     """Generates map soutions from a .sol file
 
-    :param sol: A route dictionary
-    :type Solutions: dict
+    :param sol: A route dictionary, or a list of them per vehicle like solveFleet returns
+    :type Solutions: dict or list
     :param dataframe: A dataframe consisting of at least location Longitude and Latitudes.
     :type dataframe: pd.DataFrame
-    :param TomTomKey: API key for TomTom, the route provider
+    :param TomTomKey: API key for TomTom, the route provider. Read from loadKeys if not given
     :type TomTomKey: str
-    :param MapBoxKey: API key for Plotly Mapbox, the route grapher
+    :param MapBoxKey: API key for Plotly Mapbox, the route grapher. Read from loadKeys if not given
     :type MapBoxKey: str
+    :param mapArgs: passed on to make_map, ex. tolerance=5, singleTrace=True, plotlyjs='directory'
+    :type mapArgs: dict
     """
+    if TomTomKey is None or MapBoxKey is None:
+        keys = loadKeys()
+        TomTomKey = TomTomKey or keys.get('TomTom')
+        MapBoxKey = MapBoxKey or keys.get('MapBox')
     if os.path.exists(MAP_PATH):
         shutil.rmtree(MAP_PATH)
     os.mkdir(MAP_PATH)
-    GeneratedSolution = GenerateMapSolutions(sol, dataframe, TomTomKey)
-    make_map(GeneratedSolution, dataframe, MapBoxKey, sol)
+    if isinstance(sol, list):
+        GeneratedSolution = [GenerateMapSolutions(routes, dataframe, TomTomKey) for routes in sol]
+    else:
+        GeneratedSolution = GenerateMapSolutions(sol, dataframe, TomTomKey)
+    make_map(GeneratedSolution, dataframe, MapBoxKey, sol, **mapArgs)
 
 
 if __name__ == "__main__":
+    import pandas as pd
     # Load Dist Matrix, Address data
     distMatrix = np.load(os.path.join("CachedDistances", filename + ".npy"))
     df = pd.read_csv(os.path.join(os.getcwd(), 'Data', filename+'.csv'))
     # Pull solution from .sol file
     solution = solParser(distMatrix, filename)
     # Interpret that solution
-    sol = solInterpreter(solution, distMatrix, filename)
+    sol = solInterpreter(solution, distMatrix, filename, df)
     # Graph it
-    ShowMapSolutions(sol, df, TomTomKey, MapBoxKey)
+    ShowMapSolutions(sol, df)
@@ -0,0 +1,433 @@
+# Import Statements
+from collections import deque
+import numpy as np
+
+# -------------------------------------- Working with Tours -------------------------------------- #
+
+# A tour is kept as an order, the array of locations in the order they are visited, always starting from location 0.
+# solInterpreter and the map functions take routes instead, a dictionary of each location to the one visited after it.
+# A successor array holds the same thing as routes, successor[i] is the location visited after i, -1 if there is none.
+
+def costMatrix(distMatrix:np.ndarray) -> np.ndarray:
+    """ Copies a distance matrix into float64 the solvers can work with. Missing routes become far too long to ever pick
+
+    # Arguments #
+    :arg distMatrix: N x N distances, in any dtype, possibly memory mapped
+    :type distMatrix: np.ndarray
+
+    # Returns #
+    :return costs: N x N float64 distances with no NaNs
+    :rtype costs: np.ndarray
+    """
+    costs = np.array(distMatrix, dtype=float)
+    bad = ~np.isfinite(costs)
+    if bad.any():
+        costs[bad] = (np.nanmax(np.where(bad, np.nan, costs)) + 1) * len(costs)
+    return costs
+
+
+def orderToRoutes(order:np.ndarray) -> dict:
+    """ Turns an order into routes, in the order they are driven
+
+    # Arguments #
+    :arg order: locations in the order they are visited
+    :type order: np.ndarray
+
+    # Returns #
+    :return routes: each location mapped to the location visited after it
+    :rtype routes: dict
+    """
+    order = [int(i) for i in order]
+    return dict(zip(order, order[1:] + order[:1]))
+
+
+def routesToOrder(routes:dict, start:int=0) -> np.ndarray:
+    """ Follows routes from start until it gets back around, the opposite of orderToRoutes """
+    order = [start]
+    while routes[order[-1]] != start and len(order) <= len(routes):
+        order.append(routes[order[-1]])
+    return np.array(order)
+
+
+def successorCycles(successor:np.ndarray) -> tuple:
+    """ Follows a successor array around every cycle it holds, visiting each location once, so O(N) overall.
+        A proper tour is a single cycle through every location, anything else is subtours or broken paths
+
+    # Arguments #
+    :arg successor: successor[i] is the location visited after i, -1 if there is none
+    :type successor: np.ndarray
+
+    # Returns #
+    :return cycles: one order per closed cycle, the one through location 0 first, each starting at its lowest location
+    :rtype cycles: list
+    :return stranded: locations that are not on any closed cycle, either never left or on a path that dead ends
+    :rtype stranded: np.ndarray
+    """
+    successor = np.asarray(successor)
+    NumElements = len(successor)
+    # 0 unseen, 1 on the walk in progress, 2 done
+    state = np.zeros(NumElements, dtype=np.int8)
+    cycles = []
+    for start in range(NumElements):
+        if state[start]:
+            continue
+        walk = []
+        node = start
+        while 0 <= node < NumElements and state[node] == 0:
+            state[node] = 1
+            walk.append(node)
+            node = int(successor[node])
+        if 0 <= node < NumElements and state[node] == 1:
+            # Came back around to this walk, everything from node on is a cycle
+            cycle = walk[walk.index(node):]
+            lowest = cycle.index(min(cycle))
+            cycles.append(np.array(cycle[lowest:] + cycle[:lowest]))
+        state[walk] = 2
+    cycles.sort(key=lambda cycle: cycle[0])
+    onCycle = np.zeros(NumElements, dtype=bool)
+    for cycle in cycles:
+        onCycle[cycle] = True
+    return cycles, np.flatnonzero(~onCycle)
+
+
+def tourLength(distMatrix:np.ndarray, order:np.ndarray) -> float:
+    """ Total distance of a circular tour """
+    order = np.asarray(order)
+    return float(np.asarray(distMatrix)[order, np.roll(order, -1)].sum())
+
+# -------------------------------------- Construction -------------------------------------- #
+
+def nearestNeighbour(costs:np.ndarray, start:int=0) -> np.ndarray:
+    """ Builds a tour by always going to the closest location not yet visited
+
+    # Arguments #
+    :arg costs: N x N float64 distances
+    :type costs: np.ndarray
+    :arg start: where the tour starts
+    :type start: int
+
+    # Returns #
+    :return order: locations in the order they are visited
+    :rtype order: np.ndarray
+    """
+    NumElements = len(costs)
+    visited = np.zeros(NumElements, dtype=bool)
+    order = np.empty(NumElements, dtype=int)
+    order[0] = start
+    visited[start] = True
+    for k in range(1, NumElements):
+        row = np.where(visited, np.inf, costs[order[k - 1]])
+        order[k] = np.argmin(row)
+        visited[order[k]] = True
+    return order
+
+
+def neighbourLists(costs:np.ndarray, k:int=10) -> np.ndarray:
+    """ The k closest locations to each location, closest first
+
+    # Arguments #
+    :arg costs: N x N float64 distances
+    :type costs: np.ndarray
+    :arg k: how many neighbours to keep
+    :type k: int
+
+    # Returns #
+    :return neighbours: N x k array of location indices
+    :rtype neighbours: np.ndarray
+    """
+    NumElements = len(costs)
+    k = min(k, NumElements - 1)
+    # Symmetrize so a location counts as close if it's close in either direction
+    closeness = np.minimum(costs, costs.T)
+    np.fill_diagonal(closeness, np.inf)
+    nearest = np.argpartition(closeness, k - 1, axis=1)[:, :k]
+    rows = np.arange(NumElements)[:, None]
+    return nearest[rows, np.argsort(closeness[rows, nearest], axis=1)]
+
+# -------------------------------------- Local Search -------------------------------------- #
+
+def localSearch(costs:np.ndarray, order:np.ndarray, neighbours:np.ndarray, active=None, maxSegment:int=3, region=None, maxMoves:int=None) -> np.ndarray:
+    """ Improves a tour with 2-opt and Or-opt moves until neither finds anything better. Moves are only tried between a
+        location and its neighbours, and don't-look bits skip every location whose surroundings haven't changed.
+        Distances may be asymmetric, 2-opt counts the cost of driving the reversed segment the other way.
+
+    # Arguments #
+    :arg costs: N x N float64 distances
+    :type costs: np.ndarray
+    :arg order: starting tour, the location in front never moves
+    :type order: np.ndarray
+    :arg neighbours: N x k neighbour lists from neighbourLists
+    :type neighbours: np.ndarray
+    :arg active: locations to start looking around, defaults to all of them
+    :type active: iterable
+    :arg maxSegment: longest run of locations Or-opt will move at once
+    :type maxSegment: int
+    :arg region: the only locations ever looked around, defaults to all of them. A move can still reach a neighbour
+        outside it, but that neighbour is never woken up to look further
+    :type region: iterable
+    :arg maxMoves: stop after this many improving moves, None runs until nothing improves
+    :type maxMoves: int
+
+    # Returns #
+    :return order: the improved tour
+    :rtype order: np.ndarray
+    """
+    order = np.array(order, dtype=int)
+    NumElements = len(order)
+    if NumElements < 4:
+        return order
+    position = np.empty(NumElements, dtype=int)
+    allowed = np.ones(NumElements, dtype=bool)
+    if region is not None:
+        allowed[:] = False
+        allowed[list(region)] = True
+    queue = deque(node for node in (range(NumElements) if active is None else active) if allowed[node])
+    queued = np.zeros(NumElements, dtype=bool)
+    queued[list(queue)] = True
+    eps = 1e-9
+    moves = 0
+
+    def wake(*nodes):
+        for node in nodes:
+            if allowed[node] and not queued[node]:
+                queued[node] = True
+                queue.append(node)
+
+    changed = True
+    while queue and (maxMoves is None or moves < maxMoves):
+        node = queue.popleft()
+        queued[node] = False
+        if changed:
+            nxt = np.roll(order, -1)
+            position[order] = np.arange(NumElements)
+            # Prefix sums of driving the tour forwards and backwards, so any segment's cost both ways is a subtraction
+            forward = np.concatenate(([0], np.cumsum(costs[order[:-1], order[1:]])))
+            backward = np.concatenate(([0], np.cumsum(costs[order[1:], order[:-1]])))
+            changed = False
+
+        # 2-opt: reverse order[i+1 .. j], swapping edges (i, i+1), (j, j+1) for (i, j), (i+1, j+1)
+        p = position[node]
+        q = position[neighbours[node]]
+        i, j = np.minimum(p, q), np.maximum(p, q)
+        keep = j - i >= 2
+        if keep.any():
+            i, j = i[keep], j[keep]
+            a, b = order[i], order[j]
+            a1, b1 = order[i + 1], nxt[j]
+            delta = (costs[a, b] + costs[a1, b1] - costs[a, a1] - costs[b, b1]
+                     + (backward[j] - backward[i + 1]) - (forward[j] - forward[i + 1]))
+            best = np.argmin(delta)
+            if delta[best] < -eps:
+                i, j = i[best], j[best]
+                order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+                wake(a[best], a1[best], b[best], b1[best], node)
+                changed = True
+                moves += 1
+                continue
+
+        # Or-opt: move order[p .. p+L-1] between two other neighbouring locations, keeping its direction
+        for L in range(1, maxSegment + 1):
+            if p == 0 or p + L > NumElements:
+                break
+            first, last = order[p], order[p + L - 1]
+            prev, after = order[p - 1], order[(p + L) % NumElements]
+            removeGain = costs[prev, first] + costs[last, after] - costs[prev, after]
+            # Places to go, right after a neighbour of the first location, or right before a neighbour of the last one
+            u = np.concatenate((neighbours[first], order[position[neighbours[last]] - 1]))
+            pu = position[u]
+            v = nxt[pu]
+            keep = ((pu < p - 1) | (pu >= p + L)) & (u != prev)
+            if not keep.any():
+                continue
+            u, v = u[keep], v[keep]
+            delta = costs[u, first] + costs[last, v] - costs[u, v] - removeGain
+            best = np.argmin(delta)
+            if delta[best] < -eps:
+                segment = order[p:p + L].copy()
+                rest = np.concatenate((order[:p], order[p + L:]))
+                at = int(np.flatnonzero(rest == u[best])[0]) + 1
+                order = np.concatenate((rest[:at], segment, rest[at:]))
+                wake(prev, after, first, last, u[best], v[best])
+                changed = True
+                moves += 1
+                break
+    return order
+
+# -------------------------------------- Exact Solving -------------------------------------- #
+
+def heldKarp(costs:np.ndarray, start:int=0) -> np.ndarray:
+    """ Finds the optimal tour with Held-Karp dynamic programming. The start is left out of the subsets, so the table has
+        2**(N-1) x (N-1) float32 cells, and every subset of the same size is updated at once with NumPy.
+        Time and memory double with every location, so keep N to about 20.
+
+    # Arguments #
+    :arg costs: N x N float64 distances
+    :type costs: np.ndarray
+    :arg start: where the tour starts
+    :type start: int
+
+    # Returns #
+    :return order: locations in the order they are visited, in the shortest possible tour
+    :rtype order: np.ndarray
+    """
+    NumElements = len(costs)
+    if NumElements < 3:
+        return np.arange(NumElements)
+    # Bit b of a subset stands for location others[b]
+    others = np.array([i for i in range(NumElements) if i != start])
+    n = len(others)
+    inner = costs[np.ix_(others, others)].astype(np.float32)
+    # best[subset, j]: shortest path from the start through every location in subset, ending at j
+    best = np.full((1 << n, n), np.inf, dtype=np.float32)
+    parent = np.zeros((1 << n, n), dtype=np.int8)
+    single = 1 << np.arange(n)
+    best[single, np.arange(n)] = costs[start, others]
+    # Subsets grouped by how many locations they hold
+    subsets = np.arange(1 << n)
+    sizes = np.zeros(1 << n, dtype=np.int8)
+    for b in range(n):
+        sizes += (subsets >> b) & 1
+    for size in range(2, n + 1):
+        layer = subsets[sizes == size]
+        for j in range(n):
+            ending = layer[(layer >> j) & 1 == 1]
+            before = best[ending ^ (1 << j)] + inner[:, j]
+            parent[ending, j] = np.argmin(before, axis=1)
+            best[ending, j] = before[np.arange(len(ending)), parent[ending, j]]
+    full = (1 << n) - 1
+    last = int(np.argmin(best[full] + costs[others, start].astype(np.float32)))
+    # Walk the parents back from the end of the tour
+    reverse = []
+    subset = full
+    while subset:
+        reverse.append(last)
+        subset, last = subset ^ (1 << last), int(parent[subset, last])
+    return np.concatenate(([start], others[reverse[::-1]]))
+
+
+def solveExact(distMatrix:np.ndarray, start:int=0, maxElements:int=22) -> dict:
+    """ Solves the tour to optimality in process, with Held-Karp. Only for small sites, it refuses anything over maxElements
+
+    # Arguments #
+    :arg distMatrix: N x N distances from validateCache
+    :type distMatrix: np.ndarray
+    :arg start: where the tour starts
+    :type start: int
+    :arg maxElements: largest N to attempt, 22 locations needs about 250 MB
+    :type maxElements: int
+
+    # Returns #
+    :return routes: each location mapped to the location visited after it, like solInterpreter returns
+    :rtype routes: dict
+    """
+    if len(distMatrix) > maxElements:
+        raise ValueError(f'Held-Karp needs 2**(N-1) memory, {len(distMatrix)} locations is more than the limit of {maxElements}')
+    return orderToRoutes(heldKarp(costMatrix(distMatrix), start))
+
+# -------------------------------------- Solving -------------------------------------- #
+
+def solveHeuristic(distMatrix:np.ndarray, start:int=0, neighbours:int=10) -> dict:
+    """ Solves the tour in process, no LP solver needed. Nearest neighbour builds a tour, then 2-opt and Or-opt clean it up.
+        Not guaranteed optimal, but usually within a few percent, and under a second for a few hundred locations.
+
+    # Arguments #
+    :arg distMatrix: N x N distances from validateCache
+    :type distMatrix: np.ndarray
+    :arg start: where the tour starts
+    :type start: int
+    :arg neighbours: how many close locations each location tries moves with
+    :type neighbours: int
+
+    # Returns #
+    :return routes: each location mapped to the location visited after it, like solInterpreter returns
+    :rtype routes: dict
+    """
+    costs = costMatrix(distMatrix)
+    if len(costs) < 2:
+        return {start: start}
+    order = nearestNeighbour(costs, start)
+    order = localSearch(costs, order, neighbourLists(costs, neighbours))
+    return orderToRoutes(order)
+
+# -------------------------------------- Re-optimizing -------------------------------------- #
+
+def cheapestInsertion(costs:np.ndarray, order:np.ndarray, stops) -> np.ndarray:
+    """ Adds stops to a tour one at a time, each between the two locations where it makes the tour the least longer
+
+    # Arguments #
+    :arg costs: N x N float64 distances
+    :type costs: np.ndarray
+    :arg order: tour to add to, its first location stays first
+    :type order: np.ndarray
+    :arg stops: locations to add
+    :type stops: iterable
+
+    # Returns #
+    :return order: the tour with every stop in it
+    :rtype order: np.ndarray
+    """
+    order = np.array(order, dtype=int)
+    for stop in stops:
+        if len(order) == 0:
+            order = np.array([stop])
+            continue
+        after = np.roll(order, -1)
+        delta = costs[order, stop] + costs[stop, after] - costs[order, after]
+        order = np.insert(order, int(np.argmin(delta)) + 1, stop)
+    return order
+
+
+def repairTour(distMatrix:np.ndarray, previous:np.ndarray, start:int=0, neighbours:int=10, radius:int=2, movesPerChange:int=20) -> dict:
+    """ Re-plans a tour after stops were added or removed, instead of solving from scratch. Removed stops are spliced
+        out, new ones go in by cheapest insertion, and local search stays within a few neighbours of the locations around
+        a change, for a bounded number of moves, so a few edits to a few hundred stops take milliseconds
+
+    # Arguments #
+    :arg distMatrix: N x N distances from validateCache, for the locations as they are now
+    :type distMatrix: np.ndarray
+    :arg previous: the old tour in the order it is driven, as current location numbers, -1 for removed stops, like loadTour returns
+    :type previous: np.ndarray
+    :arg start: where the tour starts
+    :type start: int
+    :arg neighbours: how many close locations each location tries moves with
+    :type neighbours: int
+    :arg radius: how many steps through the neighbour lists local search may spread from a changed location
+    :type radius: int
+    :arg movesPerChange: most improving moves local search makes, per changed location
+    :type movesPerChange: int
+
+    # Returns #
+    :return routes: each location mapped to the location visited after it, like solInterpreter returns
+    :rtype routes: dict
+    """
+    costs = costMatrix(distMatrix)
+    NumElements = len(costs)
+    previous = np.asarray(previous, dtype=int)
+    kept = np.flatnonzero(previous >= 0)
+    order = previous[kept]
+    touched = set()
+    if len(order):
+        # Locations that were not next to each other before a splice are now, wherever a stop was taken out between them
+        spliced = np.diff(np.append(kept, kept[0] + len(previous))) > 1
+        touched.update(order[spliced].tolist(), np.roll(order, -1)[spliced].tolist())
+    visited = np.zeros(NumElements, dtype=bool)
+    visited[order] = True
+    added = np.flatnonzero(~visited)
+    order = cheapestInsertion(costs, order, added)
+    position = np.empty(NumElements, dtype=int)
+    position[order] = np.arange(NumElements)
+    for stop in added.tolist():
+        touched.update((stop, int(order[position[stop] - 1]), int(order[(position[stop] + 1) % NumElements])))
+    order = np.roll(order, -position[start])
+    if NumElements >= 4 and touched:
+        closest = neighbourLists(costs, neighbours)
+        region = np.zeros(NumElements, dtype=bool)
+        frontier = np.array(sorted(touched))
+        region[frontier] = True
+        for _ in range(radius):
+            frontier = np.unique(closest[frontier])
+            frontier = frontier[~region[frontier]]
+            region[frontier] = True
+        order = localSearch(costs, order, closest, active=sorted(touched), region=np.flatnonzero(region),
+                            maxMoves=movesPerChange * len(touched))
+    return orderToRoutes(order)
@@ -0,0 +1,83 @@
+# Import Statements
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+
+# The scripts are imported as scripts.X, from the repository root, the same as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# -------------------------------------- Stub API Server -------------------------------------- #
+
+def stubMeters(origin:str, destination:str) -> int:
+    """ Made up but repeatable road distance in meters the stub gives for a route """
+    return 0 if origin == destination else 100 * len(origin) + 7 * len(destination)
+
+
+class StubServer(ThreadingHTTPServer):
+    """ Local HTTP server standing in for Google Directions and TomTom routing. Counts every call, and replies 503 to
+        the next failNext calls, and to every call whose URL mentions a string in failAlways
+    """
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.url = f'http://127.0.0.1:{self.server_port}'
+        self.lock = threading.Lock()
+        self.calls = []
+        self.failNext = 0
+        self.failAlways = set()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status:int, body:dict=None) -> None:
+        data = json.dumps(body or {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        with self.server.lock:
+            self.server.calls.append((parts.path, query))
+            failing = self.server.failNext > 0 or any(word in self.path for word in self.server.failAlways)
+            self.server.failNext = max(0, self.server.failNext - 1)
+        if failing:
+            return self.reply(503)
+        if parts.path == '/directions':
+            meters = stubMeters(query['origin'], query['destination'])
+            return self.reply(200, {'routes': [{'legs': [{'distance': {'text': f'{meters / 1000:.1f} km', 'value': meters}}]}]})
+        if parts.path.startswith('/calculateRoute/'):
+            # A straight path of three points between the ends of the leg
+            start, end = parts.path.split('/')[2].split(':')
+            (lat1, lon1), (lat2, lon2) = [map(float, point.split(',')) for point in (start, end)]
+            points = [{'latitude': lat1 + (lat2 - lat1) * t, 'longitude': lon1 + (lon2 - lon1) * t} for t in (0.25, 0.5, 0.75)]
+            return self.reply(200, {'routes': [{'legs': [{'points': points}]}]})
+        if parts.path == '/ok':
+            return self.reply(200, {'ok': True})
+        return self.reply(404)
+
+
+@pytest.fixture
+def stubServer():
+    """ A fresh stub server for each test, shut down after it """
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def noBackoff(monkeypatch):
+    """ Retries happen straight away, so tests of them don't sleep """
+    import scripts.Network
+    monkeypatch.setattr(scripts.Network.time, 'sleep', lambda seconds: None)
@@ -0,0 +1,122 @@
+# Import Statements
+from functools import partial
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import scripts.Modeler
+from conftest import stubMeters
+from scripts.Modeler import generateDistanceMatrix, pairProvider, validateCache
+
+ADDRESSES = [f'{number} Speedway, Austin, TX' for number in range(100, 110)]
+
+
+def expectedMatrix(addresses:list) -> np.ndarray:
+    """ What the stub gives for every route, in kilometers """
+    return np.array([[stubMeters(origin, destination) / 1000 for destination in addresses] for origin in addresses])
+
+
+def testFetchesEveryPair(stubServer, noBackoff):
+    stubServer.failNext = 5
+    df = pd.DataFrame({'Address': ADDRESSES[:4]})
+    provider = partial(pairProvider, url=stubServer.url + '/directions')
+    distMatrix = generateDistanceMatrix(df, 'key', provider, workers=4)
+    assert np.allclose(distMatrix, expectedMatrix(ADDRESSES[:4]))
+    # Every pair once, plus one retry per injected 503
+    assert len(stubServer.calls) == 4 * 3 + 5
+
+
+def testFailedTileKeepsTheRest(stubServer, noBackoff):
+    # Every route out of one address fails, even after retries
+    stubServer.failAlways.add('origin=103+Speedway')
+    df = pd.DataFrame({'Address': ADDRESSES[:5]})
+    provider = partial(pairProvider, url=stubServer.url + '/directions')
+    stored = []
+    distMatrix = generateDistanceMatrix(df, 'key', provider, workers=4, retries=1, store=lambda rows, cols, block: stored.append((rows, cols)))
+    failed = np.zeros((5, 5), dtype=bool)
+    failed[3, :] = True
+    np.fill_diagonal(failed, False)
+    assert np.isnan(distMatrix[failed]).all()
+    assert np.allclose(distMatrix[~failed], expectedMatrix(ADDRESSES[:5])[~failed])
+    assert len(stored) == 20 - 4
+
+
+def testRerunOnlyFetchesFailedPairs(stubServer, noBackoff, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame({'Address': ADDRESSES})
+    provider = partial(pairProvider, url=stubServer.url + '/directions')
+    stubServer.failAlways.add('origin=107+Speedway')
+    with pytest.raises(ValueError):
+        validateCache('Stub', df, 'key', provider, retries=1, workers=4)
+    assert len(stubServer.calls) == 90 + 9
+    # The routes that did come back were cached as they arrived, so the second run only asks for the failed ones
+    stubServer.failAlways.clear()
+    stubServer.calls.clear()
+    distMatrix = validateCache('Stub', df, 'key', provider, retries=1, workers=4)
+    assert len(stubServer.calls) == 9
+    assert np.allclose(distMatrix, expectedMatrix(ADDRESSES))
+
+
+def testMissingKeyFailsBeforeAnyCall(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    monkeypatch.setattr(scripts.Modeler, 'getJSON', lambda *args, **kwargs: calls.append(args))
+    # Two rows at the same address never need a call, which used to hide the missing key behind a tile that "worked"
+    df = pd.DataFrame({'Address': ADDRESSES[:3] + ADDRESSES[:1]})
+    with pytest.raises(ValueError, match='No API Key'):
+        validateCache('Stub', df, None, 'directions')
+    assert calls == []
+
+
+def testPlusJoinedAddressesReachTheAPIWithSpaces(stubServer, noBackoff, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Data files used to be read with their spaces swapped for +, as notebooks still do
+    df = pd.DataFrame({'Address': [address.replace(' ', '+') for address in ADDRESSES[:3]]})
+    provider = partial(pairProvider, url=stubServer.url + '/directions')
+    distMatrix = validateCache('Stub', df, 'key', provider, workers=2)
+    sent = {query[field] for _, query in stubServer.calls for field in ('origin', 'destination')}
+    assert sent == set(ADDRESSES[:3])
+    assert np.allclose(distMatrix, expectedMatrix(ADDRESSES[:3]))
+
+
+def testModeAliasesShareTheCache(stubServer, noBackoff, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.DataFrame({'Address': ADDRESSES[:3]})
+    provider = partial(pairProvider, url=stubServer.url + '/directions')
+    validateCache('Alias', df, 'key', provider, mode='car', workers=2)
+    assert {query['mode'] for _, query in stubServer.calls} == {'driving'}
+    stubServer.calls.clear()
+    distMatrix = validateCache('Driving', df, 'key', provider, mode='driving', workers=2)
+    assert stubServer.calls == []
+    assert np.allclose(distMatrix, expectedMatrix(ADDRESSES[:3]))
+
+
+def writeLegacySnapshot(filename:str, addresses:list, scale:float=1) -> np.ndarray:
+    """ A snapshot as saved before the pairwise cache, route j to i in cell [i, j], rounded like Google's text """
+    legacy = np.round(scale * expectedMatrix(addresses).T, 1)
+    np.save(os.path.join('CachedDistances', f'{filename}.npy'), legacy)
+    return legacy
+
+
+def testLegacySnapshotImportsAroundCachedPairs(stubServer, noBackoff, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    provider = partial(pairProvider, url=stubServer.url + '/directions')
+    # Another file's routes are cached first, and some are in the old snapshot too
+    validateCache('Test', pd.DataFrame({'Address': ADDRESSES[:3]}), 'key', provider, workers=2)
+    writeLegacySnapshot('Full', ADDRESSES[:6])
+    stubServer.calls.clear()
+    distMatrix = validateCache('Full', pd.DataFrame({'Address': ADDRESSES[:6]}), 'key', provider, workers=2)
+    assert stubServer.calls == []
+    assert np.allclose(distMatrix, expectedMatrix(ADDRESSES[:6]), atol=0.05)
+
+
+def testLegacySnapshotThatDisagreesIsRefetched(stubServer, noBackoff, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    provider = partial(pairProvider, url=stubServer.url + '/directions')
+    validateCache('Test', pd.DataFrame({'Address': ADDRESSES[:3]}), 'key', provider, workers=2)
+    # Built from other addresses that were in the file back then, with other distances
+    writeLegacySnapshot('Full', ADDRESSES[:6], scale=2)
+    stubServer.calls.clear()
+    distMatrix = validateCache('Full', pd.DataFrame({'Address': ADDRESSES[:6]}), 'key', provider, workers=2)
+    assert len(stubServer.calls) == 30 - 6
+    assert np.allclose(distMatrix, expectedMatrix(ADDRESSES[:6]))
@@ -0,0 +1,23 @@
+# Import Statements
+import pytest
+import requests
+from scripts.Network import getJSON, makeSession
+
+
+def testRetriesServerErrors(stubServer, noBackoff):
+    stubServer.failNext = 2
+    assert getJSON(makeSession(1), stubServer.url + '/ok', retries=3) == {'ok': True}
+    assert len(stubServer.calls) == 3
+
+
+def testGivesUpAfterRetries(stubServer, noBackoff):
+    stubServer.failNext = 10
+    with pytest.raises(requests.HTTPError):
+        getJSON(makeSession(1), stubServer.url + '/ok', retries=2)
+    assert len(stubServer.calls) == 3
+
+
+def testClientErrorsAreNotRetried(stubServer, noBackoff):
+    with pytest.raises(requests.HTTPError):
+        getJSON(makeSession(1), stubServer.url + '/missing', retries=3)
+    assert len(stubServer.calls) == 1
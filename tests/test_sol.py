@@ -0,0 +1,39 @@
+# Import Statements
+import os
+import numpy as np
+import pytest
+import requests
+from scripts.Sol import fetchLegs, legCachePath
+
+LEGS = [(30.2849, -97.7341, 30.2862, -97.7394), (30.2862, -97.7394, 30.2911, -97.7368), (30.2911, -97.7368, 30.2849, -97.7341)]
+
+
+def testFetchesLegsThroughErrors(stubServer, noBackoff, tmp_path):
+    stubServer.failNext = 2
+    paths = fetchLegs(LEGS, 'key', workers=3, cacheDir=str(tmp_path), url=stubServer.url + '/calculateRoute')
+    assert len(stubServer.calls) == len(LEGS) + 2
+    for leg, path in zip(LEGS, paths):
+        # Both ends pinned to the locations, with the three stub points between them
+        assert path.shape == (5, 2)
+        assert np.allclose(path[[0, -1]], [leg[:2], leg[2:]])
+
+
+def testCachedLegsMakeNoCalls(stubServer, noBackoff, tmp_path):
+    first = fetchLegs(LEGS, 'key', cacheDir=str(tmp_path), url=stubServer.url + '/calculateRoute')
+    stubServer.calls.clear()
+    second = fetchLegs(LEGS, 'key', cacheDir=str(tmp_path), url=stubServer.url + '/calculateRoute')
+    assert stubServer.calls == []
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+
+
+def testFailedLegKeepsTheRest(stubServer, noBackoff, tmp_path):
+    # Every call for the second leg fails, even after retries
+    stubServer.failAlways.add('30.2862,-97.7394:30.2911,-97.7368')
+    with pytest.raises(requests.HTTPError):
+        fetchLegs(LEGS, 'key', retries=1, cacheDir=str(tmp_path), url=stubServer.url + '/calculateRoute')
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(legCachePath(*leg, 'bicycle', str(tmp_path))) for leg in LEGS[::2])
+    stubServer.failAlways.clear()
+    stubServer.calls.clear()
+    paths = fetchLegs(LEGS, 'key', cacheDir=str(tmp_path), url=stubServer.url + '/calculateRoute')
+    assert len(stubServer.calls) == 1
+    assert all(path.shape == (5, 2) for path in paths)